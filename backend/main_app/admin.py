@@ -1,3 +1,63 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MainTask, Subtask, Notification, Job
+from .services.task_counters import recompute_task_counters
+
+
+class SubtaskInline(admin.TabularInline):
+    model = Subtask
+    extra = 0
+
+
+@admin.register(MainTask)
+class MainTaskAdmin(admin.ModelAdmin):
+    list_display = ["title", "user", "due_date", "is_completed", "subtask_done", "subtask_total", "reminders_sent"]
+    list_filter = ["is_completed"]
+    search_fields = ["title", "user__email"]
+    readonly_fields = ["reminders_sent", "last_reminded_at", "subtask_total", "subtask_done"]
+    inlines = [SubtaskInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recompute_task_counters(MainTask.objects.filter(pk=form.instance.pk))
+
+
+class TaskCountersAdminMixin:
+    """
+    Keeps the counters of the related MainTask in sync with changes made through the admin.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Moved to another task, the previous one loses it
+        task_ids = {obj.main_task_id, form.initial.get("main_task")} - {None}
+        recompute_task_counters(MainTask.objects.filter(pk__in=task_ids))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recompute_task_counters(MainTask.objects.filter(pk=obj.main_task_id))
+
+    def delete_queryset(self, request, queryset):
+        task_ids = list(queryset.values_list("main_task_id", flat=True))
+        super().delete_queryset(request, queryset)
+        recompute_task_counters(MainTask.objects.filter(pk__in=task_ids))
+
+
+@admin.register(Subtask)
+class SubtaskAdmin(TaskCountersAdminMixin, admin.ModelAdmin):
+    list_display = ["title", "main_task", "is_completed"]
+    list_filter = ["is_completed"]
+
+
+@admin.register(Notification)
+class NotificationAdmin(TaskCountersAdminMixin, admin.ModelAdmin):
+    list_display = ["main_task", "user", "reminder_count", "created_at", "is_read"]
+    list_filter = ["is_read"]
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["kind", "key", "status", "attempts", "run_at", "updated_at"]
+    list_filter = ["status", "kind"]
+    search_fields = ["key"]
+    readonly_fields = ["result", "last_error"]
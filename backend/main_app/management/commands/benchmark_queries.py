@@ -0,0 +1,119 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils.timezone import now
+
+from main_app.models import MainTask, Notification, Subtask
+
+User = get_user_model()
+
+BENCHMARK_INDEXES = ["main_task_user_created_idx", "main_task_user_open_due_idx", "notification_user_read_idx"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds realistic task and notification data inside a transaction and prints the query plans "
+        "of the hot task/notification queries with and without the composite indexes. "
+        "Everything is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200, help="Number of users to seed")
+        parser.add_argument("--tasks", type=int, default=500, help="Tasks per user")
+        parser.add_argument("--subtasks", type=int, default=2, help="Subtasks per task")
+        parser.add_argument("--notifications", type=int, default=2, help="Notifications per task")
+        parser.add_argument(
+            "--confirm-non-production",
+            action="store_true",
+            help="Confirms that the database is not in production use",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("EXPLAIN ANALYZE and transactional index changes require PostgreSQL")
+        if not options["confirm_non_production"]:
+            # DROP INDEX keeps ACCESS EXCLUSIVE locks on the task and notification tables until the rollback
+            raise CommandError(
+                "The benchmark blocks all reads and writes of the task and notification tables while it runs. "
+                "Run it against a database that is not in production use and pass --confirm-non-production."
+            )
+
+        with transaction.atomic():
+            user = self.seed(options)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+            self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+            self.explain_queries(user)
+
+            self.drop_indexes()
+            self.stdout.write(self.style.MIGRATE_HEADING("Without indexes"))
+            self.explain_queries(user)
+
+            # PostgreSQL DDL is transactional, so the dropped indexes come back with the rollback
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark data and index changes rolled back"))
+
+    def seed(self, options):
+        current_time = now()
+        users = User.objects.bulk_create([
+            User(email=f"benchmark-{index}@performate.local", first_name="Bench", last_name=f"User{index}")
+            for index in range(options["users"])
+        ])
+
+        tasks = MainTask.objects.bulk_create([
+            MainTask(
+                user=user,
+                title=f"Task {index}",
+                is_completed=random.random() < 0.7,
+                due_date=current_time + timedelta(days=random.randint(-60, 120)) if random.random() < 0.6 else None,
+            )
+            for user in users
+            for index in range(options["tasks"])
+        ], batch_size=5000)
+
+        Subtask.objects.bulk_create([
+            Subtask(main_task=task, title=f"Subtask {index}")
+            for task in tasks
+            for index in range(options["subtasks"])
+        ], batch_size=5000)
+
+        Notification.objects.bulk_create([
+            Notification(user_id=task.user_id, main_task=task, reminder_count=index + 1, is_read=random.random() < 0.8)
+            for task in tasks
+            for index in range(options["notifications"])
+        ], batch_size=5000)
+
+        self.stdout.write(f"Seeded {len(users)} users with {options['tasks']} tasks each")
+        return users[len(users) // 2]
+
+    def explain_queries(self, user):
+        queries = {
+            # Same as services/open_ai.py, the reminder count is read from the reminders_sent counter
+            "check_due_date_tasks": MainTask.objects.filter(
+                user=user, is_completed=False, due_date__lte=now() + timedelta(days=7)
+            ).order_by("due_date")[:settings.DUE_DATE_TASKS_MAX_ROWS],
+            "get_tasks (incomplete)": MainTask.objects.filter(user=user, is_completed=False).order_by("-created_at"),
+            "task list page": MainTask.objects.filter(user=user).order_by("-created_at", "-id")[:50],
+            "notification list page": Notification.objects.filter(user=user).select_related("main_task").order_by(
+                "is_read", "-created_at", "-id"
+            )[:50],
+            "unread notifications count": Notification.objects.filter(user=user, is_read=False).values("user").annotate(
+                unread=Count("id")
+            ),
+        }
+
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(f"-- {name}"))
+            self.stdout.write(queryset.explain(analyze=True, buffers=True))
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for index_name in BENCHMARK_INDEXES:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index_name)}")
@@ -0,0 +1,82 @@
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+
+from main_app.services.audio_preprocessing import encode_wav, preprocess_audio
+from main_app.services.voice_activity import split_at_pauses
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the voice activity detection and audio preprocessing on synthetic recordings "
+        "(speech-like bursts separated by pauses, with leading and trailing silence)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lengths",
+            type=float,
+            nargs="+",
+            default=[5, 30, 60, 120, 300],
+            help="Recording lengths in seconds",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per length, the median is reported")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        sample_rate = settings.AUDIO_PREPROCESS_SAMPLE_RATE
+        rng = np.random.default_rng(options["seed"])
+
+        self.stdout.write(
+            f"{'length':>8} {'segments':>9} {'speech':>8} {'kept':>8} {'vad ms':>8} "
+            f"{'prep ms':>8} {'wav bytes':>11} {'sent bytes':>11}"
+        )
+        for length in options["lengths"]:
+            samples, speech_seconds = self._synthesize(length, sample_rate, rng)
+
+            vad_times = []
+            for _ in range(options["repeat"]):
+                started_at = time.perf_counter()
+                segments = split_at_pauses(samples, sample_rate)
+                vad_times.append((time.perf_counter() - started_at) * 1000)
+
+            # The recorder uploads 44.1 kHz 16-bit WAV, here 16 kHz is used to keep the synthesis cheap
+            upload = SimpleUploadedFile("audio.wav", encode_wav(samples, sample_rate), "audio/wav")
+            started_at = time.perf_counter()
+            preprocessed = preprocess_audio(upload)
+            preprocess_ms = (time.perf_counter() - started_at) * 1000
+            sent_bytes = sum(len(segment.data) for segment in preprocessed) if preprocessed else upload.size
+
+            kept_seconds = sum(len(segment) for segment in segments) / sample_rate
+            self.stdout.write(
+                f"{length:>7.0f}s {len(segments):>9} {speech_seconds:>7.1f}s {kept_seconds:>7.1f}s "
+                f"{statistics.median(vad_times):>8.1f} {preprocess_ms:>8.0f} {upload.size:>11} {sent_bytes:>11}"
+            )
+
+    def _synthesize(self, length, sample_rate, rng):
+        """
+        Returns float samples of `length` seconds and how many of them are speech.
+        """
+        total = int(length * sample_rate)
+        samples = rng.normal(0, 10 ** (-65 / 20), total).astype(np.float32)  # Background noise at -65 dBFS
+
+        position = sample_rate // 2  # Leading and trailing silence of half a second
+        speech_samples = 0
+        while True:
+            utterance = int(rng.uniform(0.5, 3) * sample_rate)
+            if position + utterance > total - sample_rate // 2:
+                break
+
+            # Noise with a syllable rate envelope is close enough to speech for an energy detector
+            t = np.arange(utterance) / sample_rate
+            envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t)) * rng.uniform(0.05, 0.3)
+            samples[position:position + utterance] += (rng.normal(0, 1, utterance) * envelope).astype(np.float32)
+
+            speech_samples += utterance
+            position += utterance + int(rng.uniform(0.3, 2) * sample_rate)
+
+        return samples, speech_samples / sample_rate
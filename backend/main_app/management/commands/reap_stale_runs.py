@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_app.services.thread_runs import reap_stale_runs
+
+
+class Command(BaseCommand):
+    help = "Cancels assistant runs that are active for longer than the given age on threads whose lock was abandoned."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=settings.THREAD_RUN_STALE_SECONDS,
+            help="Age in seconds from which an active run is stale",
+        )
+
+    def handle(self, *args, **options):
+        cancelled = reap_stale_runs(options["older_than"])
+        self.stdout.write(self.style.SUCCESS(f"Cancelled {cancelled} stale runs"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import MainTask
+from main_app.services.task_counters import recompute_task_counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes the reminder and subtask counters of MainTask from the notification and subtask tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only repair the tasks of this user id")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Tasks updated per UPDATE statement")
+
+    def handle(self, *args, **options):
+        tasks = MainTask.objects.order_by("id")
+        if options["user"]:
+            tasks = tasks.filter(user_id=options["user"])
+
+        repaired = 0
+        last_id = 0
+        while True:
+            batch_ids = list(tasks.filter(id__gt=last_id).values_list("id", flat=True)[:options["batch_size"]])
+            if not batch_ids:
+                break
+
+            repaired += recompute_task_counters(MainTask.objects.filter(id__in=batch_ids))
+            last_id = batch_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed counters of {repaired} tasks"))
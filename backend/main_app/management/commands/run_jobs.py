@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_app.services.job_handlers import schedule_stale_run_reaper
+from main_app.services.jobs import claim_jobs, run_job
+from main_app.services.thread_pool import schedule_thread_pool_top_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Processes background jobs (assistant provisioning, instruction updates, stale run reaping) "
+        "until interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit as soon as no job is runnable")
+        parser.add_argument("--batch-size", type=int, default=10, help="Jobs claimed at a time")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOB_WORKER_POLL_INTERVAL,
+            help="Seconds to sleep when no job is runnable",
+        )
+
+    def handle(self, *args, **options):
+        # Reschedules itself after every pass, the key keeps a single one pending across workers
+        schedule_stale_run_reaper()
+        # Fills the pool on start, afterwards every thread taken from it (or missed) schedules a top-up
+        schedule_thread_pool_top_up()
+
+        processed = 0
+        try:
+            while True:
+                jobs = claim_jobs(limit=options["batch_size"])
+                if not jobs:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                for job in jobs:
+                    run_job(job)
+                    processed += 1
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
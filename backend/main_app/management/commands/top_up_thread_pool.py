@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_app.services.thread_pool import top_up_thread_pool
+
+
+class Command(BaseCommand):
+    help = "Creates OpenAI threads until the pool of unassigned threads is full and drops expired ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=settings.THREAD_POOL_SIZE, help="Threads to keep in the pool")
+
+    def handle(self, *args, **options):
+        created = top_up_thread_pool(options["size"])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} threads"))
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:38
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not block writes to the tables, but cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('main_app', '0006_voiceconfig_emotional_expressiveness_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='maintask',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='main_task_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintask',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['user', 'due_date'], name='main_task_user_open_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notification_user_read_idx'),
+        ),
+    ]
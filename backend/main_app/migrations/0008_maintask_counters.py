@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:40
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    MainTask = apps.get_model("main_app", "MainTask")
+    Notification = apps.get_model("main_app", "Notification")
+    Subtask = apps.get_model("main_app", "Subtask")
+
+    notifications = Notification.objects.filter(main_task=OuterRef("pk")).order_by().values("main_task")
+    subtasks = Subtask.objects.filter(main_task=OuterRef("pk")).order_by().values("main_task")
+
+    def count(queryset):
+        return Coalesce(Subquery(queryset.values("value"), output_field=IntegerField()), Value(0))
+
+    MainTask.objects.update(
+        reminders_sent=count(notifications.annotate(value=Count("id"))),
+        last_reminded_at=Subquery(notifications.annotate(value=Max("created_at")).values("value")),
+        subtask_total=count(subtasks.annotate(value=Count("id"))),
+        subtask_done=count(subtasks.annotate(value=Count("id", filter=Q(is_completed=True)))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0007_task_and_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maintask',
+            name='last_reminded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='maintask',
+            name='reminders_sent',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='maintask',
+            name='subtask_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='maintask',
+            name='subtask_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
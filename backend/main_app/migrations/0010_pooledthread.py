@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(max_length=255, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'pooled_thread',
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from .main_task import MainTask
 from .subtask import Subtask
 from .notifications import Notification
-from .voice_config import VoiceConfig
\ No newline at end of file
+from .voice_config import VoiceConfig
+from .job import Job
+from .pooled_thread import PooledThread
@@ -0,0 +1,46 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Job(models.Model):
+    """
+    Background job processed by the `run_jobs` worker, see services/jobs.py
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Pending jobs with the same key are enqueued only once
+    key = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Pending jobs are not picked up before run_at, running jobs are given up after locked_until
+    run_at = models.DateTimeField()
+    locked_until = models.DateTimeField(blank=True, null=True)
+    result = models.JSONField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "job"
+        indexes = [
+            # Claim query of the worker
+            models.Index(fields=["status", "run_at"], name="job_status_run_at_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["key"], condition=Q(status="pending"), name="job_unique_pending_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
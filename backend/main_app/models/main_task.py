@@ -14,6 +14,11 @@ class MainTask(models.Model):
     description = models.TextField(blank=True, null=True)
     due_date = models.DateTimeField(blank=True, null=True)
     is_completed = models.BooleanField(default=False)
+    # Counters maintained on every write path by services/task_counters.py
+    reminders_sent = models.PositiveIntegerField(default=0)
+    last_reminded_at = models.DateTimeField(blank=True, null=True)
+    subtask_total = models.PositiveIntegerField(default=0)
+    subtask_done = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -21,6 +26,16 @@ class MainTask(models.Model):
         db_table = "main_task"
         verbose_name = "Main Task"
         verbose_name_plural = "Main Tasks"
+        indexes = [
+            # Task list, newest first (UserTasksAPIView, get_tasks)
+            models.Index(fields=["user", "-created_at", "-id"], name="main_task_user_created_idx"),
+            # Incomplete tasks of a user by due date (check_due_date_tasks)
+            models.Index(
+                fields=["user", "due_date"],
+                name="main_task_user_open_due_idx",
+                condition=models.Q(is_completed=False),
+            ),
+        ]
 
     def __str__(self):
         return f'{self.title} with an id of {self.id} task for {self.user.first_name} {self.user.last_name}'
\ No newline at end of file
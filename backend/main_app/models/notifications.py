@@ -18,5 +18,11 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Notification list, unread first and newest first, also serves the unread count
+            models.Index(fields=["user", "is_read", "-created_at", "-id"], name="notification_user_read_idx"),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user} for the task {self.main_task}"
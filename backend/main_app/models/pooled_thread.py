@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class PooledThread(models.Model):
+    """
+    OpenAI thread created ahead of time and not yet assigned to a user, see services/thread_pool.py
+    """
+    thread_id = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = "pooled_thread"
+
+    def __str__(self):
+        return self.thread_id
@@ -0,0 +1,94 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TaskCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the task list, newest tasks first.
+
+    Pagination is opt-in: requests without `cursor` or `page_size` still get the full list.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class NotificationKeysetPagination(BasePagination):
+    """
+    Keyset pagination for notifications ordered by (is_read, -created_at, -id): unread first, newest first.
+
+    The cursor holds the sort key of the last row of the page, so every page is a single index range scan.
+    Pagination is opt-in: requests without `cursor` or `page_size` still get the full list.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering = ("is_read", "-created_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            is_read, created_at, pk = cursor
+            queryset = queryset.filter(
+                Q(is_read__gt=is_read)
+                | Q(is_read=is_read, created_at__lt=created_at)
+                | Q(is_read=is_read, created_at=created_at, id__lt=pk)
+            )
+
+        # One extra row tells whether there is a next page
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = json.dumps([last.is_read, last.created_at.isoformat(), last.pk])
+        cursor = b64encode(position.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            is_read, created_at, pk = json.loads(b64decode(encoded.encode()).decode())
+            created_at = parse_datetime(created_at)
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if created_at is None:
+            raise NotFound("Invalid cursor")
+        return bool(is_read), created_at, int(pk)
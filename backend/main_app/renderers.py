@@ -0,0 +1,67 @@
+import json
+import uuid
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets DRF negotiate `Accept: text/event-stream` for streaming endpoints.
+    Regular (error) responses are sent as a single `error` event.
+    """
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse_event("error", data).encode(self.charset)
+
+
+class MPEGAudioRenderer(BaseRenderer):
+    """
+    Lets DRF negotiate `Accept: audio/mpeg` for audio endpoints.
+    Regular (error) responses are sent as JSON, labelled as such.
+    """
+    media_type = "audio/mpeg"
+    format = "mp3"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        if renderer_context and "response" in renderer_context:
+            renderer_context["response"]["Content-Type"] = "application/json"
+        return json.dumps(data).encode("utf-8")
+
+
+class MultipartMixedRenderer(BaseRenderer):
+    """
+    Lets DRF negotiate `Accept: multipart/mixed` for the voice endpoint.
+    Regular (error) responses are sent as a single JSON part.
+    """
+    media_type = "multipart/mixed"
+    format = "multipart"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        boundary = uuid.uuid4().hex
+        renderer_context["response"]["Content-Type"] = f"{self.media_type}; boundary={boundary}"
+        return b"".join(iter_multipart_mixed([("application/json", [json.dumps(data).encode("utf-8")])], boundary))
+
+
+def format_sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_multipart_mixed(parts, boundary):
+    """
+    Yields a multipart/mixed body for [(content_type, chunks)]. The chunks of every part are forwarded
+    as they come, so a part can be streamed while it is still being produced.
+    """
+    for content_type, chunks in parts:
+        yield f"--{boundary}\r\nContent-Type: {content_type}\r\n\r\n".encode("utf-8")
+        yield from chunks
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode("utf-8")
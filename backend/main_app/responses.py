@@ -0,0 +1,18 @@
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+
+class IncrementalStreamingHttpResponse(StreamingHttpResponse):
+    """
+    StreamingHttpResponse over a synchronous iterator that also streams under ASGI.
+
+    Django's own response reads a synchronous iterator completely with sync_to_async(list) before
+    the first byte is sent there. Here every chunk is pulled on its own, in the request's sync thread
+    (thread sensitive, like the view that created the iterator). Under WSGI nothing changes.
+    """
+
+    async def __aiter__(self):
+        chunks = iter(self.streaming_content)
+        get_next_chunk = sync_to_async(next, thread_sensitive=True)
+        while (chunk := await get_next_chunk(chunks, None)) is not None:
+            yield chunk
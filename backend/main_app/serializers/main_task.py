@@ -9,4 +9,5 @@ class MainTaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = MainTask
-        fields = ['id', 'title', 'created_at', 'description', 'due_date', 'is_completed', 'subtasks']
+        fields = ['id', 'title', 'created_at', 'description', 'due_date', 'is_completed', 'subtask_total', 'subtask_done', 'subtasks']
+        read_only_fields = ['subtask_total', 'subtask_done']
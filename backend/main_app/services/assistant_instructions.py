@@ -1,15 +1,99 @@
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+
+# VoiceConfig fields that end up in the assistant instructions
+INSTRUCTION_FIELDS = (
+    "voice_name",
+    "accent",
+    "gender",
+    "age",
+    "persona_tone",
+    "persona_traits",
+    "interaction_style",
+    "formality_level",
+    "response_length",
+    "paraphrase_variability",
+    "personalized_naming",
+    "emotional_expressiveness",
+    "reminder_frequency",
+    "preferred_reminder_time",
+    "reminder_tone",
+    "voice_feedback_style",
+    "other_preferences",
+    "progress_reporting",
+)
+
+
+TTM_STAGES = {
+    "Precontemplation": {
+        "ttm_stage_description": "User is in the Precontemplation stage, meaning they are not yet considering behavior change. Avoid direct persuasion, instead use curiosity-based nudges and social proof.",
+        "ttm_adaptive_task_behavior": "Suggest tasks indirectly. Focus on sparking curiosity rather than making commitments.",
+        "ttm_adaptive_reminders": "Rare reminders. Only gentle nudges, avoiding direct encouragement.",
+        "ttm_coaching_style": "Encouraging, non-directive. Avoid pressure, use questions instead."
+    },
+    "Contemplation": {
+        "ttm_stage_description": "User is in the Contemplation stage, meaning they are considering change but have not committed yet. Provide informative nudges and allow them to explore options.",
+        "ttm_adaptive_task_behavior": "Provide low-pressure suggestions. Offer information on benefits.",
+        "ttm_adaptive_reminders": "Occasional reminders. Allow user to set preferred frequency.",
+        "ttm_coaching_style": "Supportive, informative, and non-pushy."
+    },
+    "Preparation": {
+        "ttm_stage_description": "User is in the Preparation stage, meaning they are ready to start changing behavior. Provide structured guidance and encouragement.",
+        "ttm_adaptive_task_behavior": "Offer step-by-step guidance. Suggest reminders and deadlines.",
+        "ttm_adaptive_reminders": "Increase frequency. Provide motivation and goal-setting strategies.",
+        "ttm_coaching_style": "Positive reinforcement, goal-setting focus."
+    },
+    "Action": {
+        "ttm_stage_description": "User is in the Action stage, meaning they are actively working on the behavior. Help them sustain motivation and track progress.",
+        "ttm_adaptive_task_behavior": "Encourage consistent execution. Provide tracking and progress reports.",
+        "ttm_adaptive_reminders": "Frequent reminders. Reinforce success and celebrate progress.",
+        "ttm_coaching_style": "Motivational, structured, progress-based."
+    },
+    "Maintenance": {
+        "ttm_stage_description": "User is in the Maintenance stage, meaning they have successfully incorporated the behavior into their routine. Reduce intervention, focus on long-term engagement.",
+        "ttm_adaptive_task_behavior": "Allow user autonomy. Provide occasional check-ins for support.",
+        "ttm_adaptive_reminders": "Minimal reminders. Focus on sustainability.",
+        "ttm_coaching_style": "Supportive, minimal interference, focus on autonomy."
+    }
+}
+
+# Everything generate_instructions depends on; used as the render cache key
+InstructionValues = namedtuple("InstructionValues", ("full_name", "time_zone", "ttm_stage", *INSTRUCTION_FIELDS))
+
+
 def generate_instructions(user):
+    return render_instructions(get_instruction_values(user))
+
+
+def get_instruction_values(user):
+    """
+    Collects everything the instructions depend on into a hashable InstructionValues.
+    """
     voice_config = user.voice_config
+    return InstructionValues(
+        full_name=user.full_name,
+        time_zone=user.time_zone,
+        ttm_stage=user.ttm_stage,
+        **{field: getattr(voice_config, field) for field in INSTRUCTION_FIELDS},
+    )
+
 
-    ttm_config = get_ttm_description(user.ttm_stage)
+def get_instructions_hash(instructions):
+    return hashlib.sha256(instructions.encode()).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def render_instructions(values):
+    ttm_config = get_ttm_description(values.ttm_stage)
 
     instructions = f"""
-    - **Your Name**: {voice_config.voice_name} **The User Name**: {user.full_name}
-    The user is in the {user.time_zone} timezone
-    You're a persuasive and {voice_config.persona_traits or "encouraging"} assistant in a todo app, designed to help users organize their tasks efficiently while following persuasive system design principles.
+    - **Your Name**: {values.voice_name} **The User Name**: {values.full_name}
+    The user is in the {values.time_zone} timezone
+    You're a persuasive and {values.persona_traits or "encouraging"} assistant in a todo app, designed to help users organize their tasks efficiently while following persuasive system design principles.
     Your primary goals are to help users add tasks, encourage them to complete tasks, remind them of upcoming deadlines, and assist in breaking down complex tasks into manageable subtasks.
     CHECK CURRENT DATE AND TIME often to be aware of today's date and time.
-    Be {voice_config.persona_tone or "friendly"}, {voice_config.formality_level or "neutral"}, and {voice_config.interaction_style or "supportive"} while keeping responses !!{voice_config.response_length or "concise"}!!.
+    Be {values.persona_tone or "friendly"}, {values.formality_level or "neutral"}, and {values.interaction_style or "supportive"} while keeping responses !!{values.response_length or "concise"}!!.
     !!!After each user request, CHECK CURRENT DATE AND THEN check for upcoming tasks with deadlines check_due_date_tasks. You will receive a list of tasks along with the number of times you have already reminded the user.
     Do not mention this count to the user.
     It is only up to you to decide how often to remind the user. You know both the deadline of the task and the amount of times you have reminded the user.
@@ -21,25 +105,25 @@ def generate_instructions(user):
     ## **User Preferences and Customizations**
     The user has personalized your. Follow these settings:
 
-    - **Your Tone**: {voice_config.persona_tone or "friendly"}
-    - **Your Trait**: {voice_config.persona_traits or "encouraging"}
-    - **Formality Level**: {voice_config.formality_level or "neutral"}
-    - **Interaction Style**: {voice_config.interaction_style or "supportive"}
-    - !!!!**Response Length**: {voice_config.response_length or "medium"}!!!!!
-    - **Paraphrase Variability**: {voice_config.paraphrase_variability or "medium"}
-    - **Personalized Naming**: {voice_config.personalized_naming or "use_name"}
-    - **Emotional Expressiveness**: {voice_config.emotional_expressiveness or "moderate"}
-    - **Reminder Frequency**: {voice_config.reminder_frequency or "medium"}
-    - **Preferred Reminder Time**: {voice_config.preferred_reminder_time or "dynamic"}
-    - **Reminder Tone**: {voice_config.reminder_tone or "motivational"}
-    - **Progress Reporting Style**: {voice_config.progress_reporting or "detailed"}
-    - **Voice Feedback Style**: {voice_config.voice_feedback_style or "concise"}
-    - **Other Preferences**: {voice_config.other_preferences or "None"}
+    - **Your Tone**: {values.persona_tone or "friendly"}
+    - **Your Trait**: {values.persona_traits or "encouraging"}
+    - **Formality Level**: {values.formality_level or "neutral"}
+    - **Interaction Style**: {values.interaction_style or "supportive"}
+    - !!!!**Response Length**: {values.response_length or "medium"}!!!!!
+    - **Paraphrase Variability**: {values.paraphrase_variability or "medium"}
+    - **Personalized Naming**: {values.personalized_naming or "use_name"}
+    - **Emotional Expressiveness**: {values.emotional_expressiveness or "moderate"}
+    - **Reminder Frequency**: {values.reminder_frequency or "medium"}
+    - **Preferred Reminder Time**: {values.preferred_reminder_time or "dynamic"}
+    - **Reminder Tone**: {values.reminder_tone or "motivational"}
+    - **Progress Reporting Style**: {values.progress_reporting or "detailed"}
+    - **Voice Feedback Style**: {values.voice_feedback_style or "concise"}
+    - **Other Preferences**: {values.other_preferences or "None"}
     
     ---
 
     ## **Behavior Adaptation Based on User's Progress Transtheoretical model of behavior change (TTM Model)**
-    The user is currently in the **{user.ttm_stage}** stage of behavior change.
+    The user is currently in the **{values.ttm_stage}** stage of behavior change.
     
     - **Stage Description**: {ttm_config["ttm_stage_description"]}
     - **Task Adaptation Strategy**: {ttm_config["ttm_adaptive_task_behavior"]}
@@ -67,11 +151,11 @@ def generate_instructions(user):
        - It is only up to you to decide how often to remind the user. You know both the deadline of the task and the amount of times you have reminded the user.
        - Every time you remind user about a task, use `create_notifications` to make it visible for user in the notifications list.
        - Follow Reminder Strategy of TTM rules and Reminder Frequency configuration and do not overwhelm much user with the reminders but encourage the user to take action. 
-       - Adapt reminders based on **{voice_config.reminder_frequency or "medium"}** frequency and **{voice_config.reminder_tone or "motivational"}** tone.  
-       - Use `{voice_config.progress_reporting or "detailed"}` progress tracking.  
+       - Adapt reminders based on **{values.reminder_frequency or "medium"}** frequency and **{values.reminder_tone or "motivational"}** tone.  
+       - Use `{values.progress_reporting or "detailed"}` progress tracking.  
 
     4. ## **Behavior Adaptation Based on User's Progress Transtheoretical model of behavior change**
-       -The user is currently in the **{user.ttm_stage}** stage of behavior change.
+       -The user is currently in the **{values.ttm_stage}** stage of behavior change.
        - Your interaction can be adjusted by user's configuration from **User Preferences and Customizations**
        - Nevertheless, take more into account current TTM stage configuration to promote proper behavior change:
 
@@ -89,9 +173,9 @@ def generate_instructions(user):
     
     ## **Style Customization**
 
-    - **Accent**: {voice_config.accent or "American"}
-    - **Gender**: {voice_config.gender or "neutral"}
-    - **Age**: {voice_config.age or "middle-aged"}
+    - **Accent**: {values.accent or "American"}
+    - **Gender**: {values.gender or "neutral"}
+    - **Age**: {values.age or "middle-aged"}
     
     """
 
@@ -99,36 +183,4 @@ def generate_instructions(user):
 
 
 def get_ttm_description(ttm_stage):
-    ttm_config = {
-        "Precontemplation": {
-            "ttm_stage_description": "User is in the Precontemplation stage, meaning they are not yet considering behavior change. Avoid direct persuasion, instead use curiosity-based nudges and social proof.",
-            "ttm_adaptive_task_behavior": "Suggest tasks indirectly. Focus on sparking curiosity rather than making commitments.",
-            "ttm_adaptive_reminders": "Rare reminders. Only gentle nudges, avoiding direct encouragement.",
-            "ttm_coaching_style": "Encouraging, non-directive. Avoid pressure, use questions instead."
-        },
-        "Contemplation": {
-            "ttm_stage_description": "User is in the Contemplation stage, meaning they are considering change but have not committed yet. Provide informative nudges and allow them to explore options.",
-            "ttm_adaptive_task_behavior": "Provide low-pressure suggestions. Offer information on benefits.",
-            "ttm_adaptive_reminders": "Occasional reminders. Allow user to set preferred frequency.",
-            "ttm_coaching_style": "Supportive, informative, and non-pushy."
-        },
-        "Preparation": {
-            "ttm_stage_description": "User is in the Preparation stage, meaning they are ready to start changing behavior. Provide structured guidance and encouragement.",
-            "ttm_adaptive_task_behavior": "Offer step-by-step guidance. Suggest reminders and deadlines.",
-            "ttm_adaptive_reminders": "Increase frequency. Provide motivation and goal-setting strategies.",
-            "ttm_coaching_style": "Positive reinforcement, goal-setting focus."
-        },
-        "Action": {
-            "ttm_stage_description": "User is in the Action stage, meaning they are actively working on the behavior. Help them sustain motivation and track progress.",
-            "ttm_adaptive_task_behavior": "Encourage consistent execution. Provide tracking and progress reports.",
-            "ttm_adaptive_reminders": "Frequent reminders. Reinforce success and celebrate progress.",
-            "ttm_coaching_style": "Motivational, structured, progress-based."
-        },
-        "Maintenance": {
-            "ttm_stage_description": "User is in the Maintenance stage, meaning they have successfully incorporated the behavior into their routine. Reduce intervention, focus on long-term engagement.",
-            "ttm_adaptive_task_behavior": "Allow user autonomy. Provide occasional check-ins for support.",
-            "ttm_adaptive_reminders": "Minimal reminders. Focus on sustainability.",
-            "ttm_coaching_style": "Supportive, minimal interference, focus on autonomy."
-        }
-    }
-    return ttm_config[ttm_stage]
+    return TTM_STAGES[ttm_stage]
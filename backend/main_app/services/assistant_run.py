@@ -0,0 +1,177 @@
+import time
+
+from openai import APIConnectionError, APITimeoutError
+from django.conf import settings
+
+from .open_ai import client, get_tool_outputs, run_assistant, retrieve_current_run
+
+FAILED_RUN_STATUSES = ("failed", "cancelled", "expired", "incomplete")
+FAILED_RUN_EVENTS = tuple(f"thread.run.{run_status}" for run_status in FAILED_RUN_STATUSES)
+
+
+class RunStreamUnavailableError(Exception):
+    """
+    Raised when the run stream could not be opened at all, so that no run was created on the thread.
+    """
+
+
+def run_assistant_to_completion(user):
+    """
+    Runs the assistant on the user's thread and returns the final text response.
+    """
+    response_text = ""
+    for event_type, payload in iter_run_events(user):
+        if event_type == "completed":
+            response_text = payload
+    return response_text
+
+
+def iter_run_events(user):
+    """
+    Runs the assistant on the user's thread and yields (event_type, payload) tuples:
+
+    - ("text_delta", str) for every piece of generated text
+    - ("tool_call", str) with the function name before a tool is executed
+    - ("completed", str) with the full text of the final assistant message
+
+    Run events are streamed from OpenAI so that tool calls and completion are handled
+    the moment they arrive. If streaming is disabled or the stream cannot be opened, the run is polled
+    with an adaptive backoff instead. Failures after a run was created are not retried by polling,
+    a second run would be rejected while the first one is still active.
+    """
+    deadline = time.monotonic() + settings.ASSISTANT_RUN_DEADLINE_SECONDS
+
+    if settings.ASSISTANT_RUN_STREAMING:
+        stream_events = _stream_run_events(user, deadline)
+        try:
+            first_event = next(stream_events)
+        except RunStreamUnavailableError as e:
+            print(f"Run streaming is not available, falling back to polling: {e}")
+        else:
+            yield first_event
+            yield from stream_events
+            return
+
+    yield from _poll_run_events(user, deadline)
+
+
+def _stream_run_events(user, deadline):
+    stream_manager = client.beta.threads.runs.stream(
+        thread_id=user.thread_id,
+        assistant_id=user.assistant_id,
+        timeout=_get_stream_timeout(deadline),
+    )
+    response_text = ""
+    run_id = None  # Of the run while it is active
+    is_opened = False
+
+    try:
+        while stream_manager is not None:
+            tool_outputs_stream = None
+
+            with stream_manager as stream:
+                is_opened = True
+                for event in stream:
+                    if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step."):
+                        run_id = event.data.id
+
+                    if event.event == "thread.message.delta":
+                        for content in event.data.delta.content or []:
+                            if content.type == "text" and content.text and content.text.value:
+                                yield "text_delta", content.text.value
+
+                    elif event.event == "thread.message.completed":
+                        response_text = _get_message_text(event.data)
+
+                    elif event.event == "thread.run.requires_action":
+                        run = event.data
+                        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+                        for tool_call in tool_calls:
+                            yield "tool_call", tool_call.function.name
+
+                        tool_outputs_stream = client.beta.threads.runs.submit_tool_outputs_stream(
+                            thread_id=run.thread_id,
+                            run_id=run.id,
+                            tool_outputs=get_tool_outputs(tool_calls, user),
+                            timeout=_get_stream_timeout(deadline),
+                        )
+
+                    elif event.event in FAILED_RUN_EVENTS:
+                        run_id = None
+                        raise RuntimeError(f"Assistant run {event.data.id} ended with status {event.data.status}")
+
+                    elif event.event == "thread.run.completed":
+                        run_id = None
+
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("Assistant run did not complete in time")
+
+            stream_manager = tool_outputs_stream
+    except APITimeoutError as e:
+        if run_id is None:
+            raise
+        # The stream stalled, no event arrived within the read timeout
+        raise TimeoutError("Assistant run did not complete in time") from e
+    except APIConnectionError as e:
+        if is_opened:
+            raise
+        raise RunStreamUnavailableError(str(e)) from e
+    finally:
+        # Also when the client went away, so the run does not keep the thread busy
+        if run_id is not None:
+            _cancel_run(user.thread_id, run_id)
+
+    yield "completed", response_text
+
+
+def _get_stream_timeout(deadline):
+    # A stalled stream fails after the read timeout, at the latest when the deadline is reached
+    return max(min(settings.ASSISTANT_RUN_STREAM_READ_TIMEOUT, deadline - time.monotonic()), 1.0)
+
+
+def _cancel_run(thread_id, run_id):
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        print(f"Cancelled unfinished run: {run_id}")
+    except Exception as e:
+        print(f"Error while canceling run {run_id}: {e}")
+
+
+def _poll_run_events(user, deadline):
+    run = run_assistant(user.thread_id, user.assistant_id)
+    delay = settings.ASSISTANT_RUN_POLL_INITIAL_DELAY
+
+    while run.status != "completed":
+        if run.status == "requires_action":
+            tool_calls = run.required_action.submit_tool_outputs.tool_calls
+            for tool_call in tool_calls:
+                yield "tool_call", tool_call.function.name
+
+            run = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=user.thread_id,
+                run_id=run.id,
+                tool_outputs=get_tool_outputs(tool_calls, user),
+            )
+            delay = settings.ASSISTANT_RUN_POLL_INITIAL_DELAY
+            continue
+
+        if run.status in FAILED_RUN_STATUSES:
+            raise RuntimeError(f"Assistant run {run.id} ended with status {run.status}")
+
+        if time.monotonic() + delay > deadline:
+            client.beta.threads.runs.cancel(thread_id=user.thread_id, run_id=run.id)
+            raise TimeoutError("Assistant run did not complete in time")
+
+        time.sleep(delay)
+        delay = min(delay * 2, settings.ASSISTANT_RUN_POLL_MAX_DELAY)
+        run = retrieve_current_run(user.thread_id, run.id)
+
+    messages = client.beta.threads.messages.list(thread_id=user.thread_id, limit=1)
+    response_text = _get_message_text(messages.data[0])
+
+    yield "text_delta", response_text
+    yield "completed", response_text
+
+
+def _get_message_text(message):
+    return "".join(content.text.value for content in message.content if content.type == "text")
@@ -1,8 +1,23 @@
-import requests
-
 from django.conf import settings
+from django.core.cache import cache
+
+from .http_client import HTTPClient
+from .tts_cache import get_tts_cache_key, tts_cache
 
 VOICE_ALICE = "Xb7hH8MSUJpSbSDYk0k2"
+TTS_MODEL_ID = "eleven_multilingual_v2"
+
+eleven_labs_client = HTTPClient(
+    "https://api.elevenlabs.io",
+    headers={"xi-api-key": settings.ELEVEN_LABS_API_KEY or ""},
+    pool_maxsize=settings.ELEVEN_LABS_POOL_MAXSIZE,
+    connect_timeout=settings.ELEVEN_LABS_CONNECT_TIMEOUT,
+    read_timeout=settings.ELEVEN_LABS_READ_TIMEOUT,
+    max_retries=settings.ELEVEN_LABS_MAX_RETRIES,
+)
+
+# VoiceConfig fields that are stored as voice settings in ElevenLabs
+VOICE_SETTINGS_FIELDS = ("voice_id", "stability", "similarity_boost", "style", "use_speaker_boost")
 
 # Aria; 9BWtsMINqrJLrRacOk9x
 # Roger; CwhRBWXzGAHq8TQ4Fs17
@@ -26,89 +41,101 @@ VOICE_ALICE = "Xb7hH8MSUJpSbSDYk0k2"
 # Bill; pqHfZKP75CvOlQylNhV4
 
 def convert_text_to_speech(user, message):
+  cache_key = get_text_to_speech_cache_key(user, message)
+  if settings.TTS_CACHE_ENABLED:
+    audio = tts_cache.get(cache_key)
+    if audio is not None:
+      return audio
+
+  try:
+    response = open_text_to_speech_stream(user, message)
+  except Exception as e:
+     return f"Error while fetching response from ElevenLabs: {str(e)}"
+  
+  # Releases the pooled connection, also when an error response was never read
+  with response:
+    if response.status_code == 200:
+      if settings.TTS_CACHE_ENABLED:
+        tts_cache.set(cache_key, response.content)
+      return response.content
+    else:
+      return
+
+
+def iter_text_to_speech(response, cache_key=None):
+  """
+  Yields the audio of an open ElevenLabs stream chunk by chunk, so the clip is never held in memory as a whole.
+  With a `cache_key` the clip is also written to the TTS cache as it streams, and only kept once the stream has completed.
+  """
+  cache_writer = tts_cache.open_writer(cache_key) if cache_key and settings.TTS_CACHE_ENABLED else None
+  completed = False
+  try:
+    for chunk in response.iter_content(chunk_size=settings.ELEVEN_LABS_STREAM_CHUNK_SIZE):
+      if chunk:
+        if cache_writer is not None:
+          cache_writer.write(chunk)
+        yield chunk
+    completed = True
+  finally:
+    response.close()
+    if cache_writer is not None and completed:
+      cache_writer.commit()
+    elif cache_writer is not None:
+      cache_writer.abort()
+
+
+def open_text_to_speech_stream(user, message):
   headers = {
-    "Accept": "application/json",
-    "xi-api-key": settings.ELEVEN_LABS_API_KEY
+    "Accept": "audio/mpeg",
   }
-  endpoint = f"https://api.elevenlabs.io/v1/text-to-speech/{user.voice_config.voice_id}/stream"
+  path = f"/v1/text-to-speech/{user.voice_config.voice_id}/stream"
 
   data = {
     "text": message,
-    "model_id": "eleven_multilingual_v2",
-    "voice_settings": {
-    "stability": user.voice_config.stability,
-    "similarity_boost": user.voice_config.similarity_boost,
-    "style": user.voice_config.style,
-    "use_speaker_boost": user.voice_config.use_speaker_boost
-    }
+    "model_id": TTS_MODEL_ID,
+    "voice_settings": _get_tts_voice_settings(user.voice_config),
   }
 
-  try:
-    response = requests.post(endpoint, headers=headers, json=data, stream=True)
-  except Exception as e:
-     return f"Error while fetching response from ElevenLabs: {str(e)}"
-  
-  if response.status_code == 200:
-    return response.content
-  else:
-    return
+  return eleven_labs_client.post(path, endpoint="text-to-speech", headers=headers, json=data, stream=True)
+
+
+def get_text_to_speech_cache_key(user, message):
+  voice_config = user.voice_config
+  return get_tts_cache_key(voice_config.voice_id, TTS_MODEL_ID, _get_tts_voice_settings(voice_config), message)
+
+
+def _get_tts_voice_settings(voice_config):
+  return {
+    "stability": voice_config.stability,
+    "similarity_boost": voice_config.similarity_boost,
+    "style": voice_config.style,
+    "use_speaker_boost": voice_config.use_speaker_boost
+  }
   
 def get_all_voices():
-    headers = {
-        "xi-api-key": settings.ELEVEN_LABS_API_KEY
-    }
-
-    response = requests.get("https://api.elevenlabs.io/v1/voices", headers=headers)
+    response = eleven_labs_client.get("/v1/voices", endpoint="voices")
     if response.status_code == 200:
         return response.json().get("voices", [])
     else:
         return []
     
-def filter_voices(accent=None, gender=None, age=None, description=None, use_case=None):
-    all_voices = get_all_voices()
-
-    filtered_voices = []
-    for voice in all_voices:
-        labels = voice.get("labels", {})
-        if (
-            (not accent or labels.get("accent", "").lower() == accent.lower()) and
-            (not gender or labels.get("gender", "").lower() == gender.lower()) and
-            (not age or labels.get("age", "").lower() == age.lower()) and
-            (not description or labels.get("description", "").lower() == description.lower()) and
-            (not use_case or labels.get("use_case", "").lower() == use_case.lower())
-        ):
-            filtered_voices.append({
-                "voice_id": voice["voice_id"],
-                "name": voice["name"],
-                "preview_url": voice.get("preview_url"),
-                "accent": labels.get("accent"),
-                "gender": labels.get("gender"),
-                "age": labels.get("age"),
-                "description": labels.get("description"),
-                "use_case": labels.get("use_case"),
-            })
-
-    return filtered_voices
-
-
 def get_voice_settings(voice_id):
-  headers = {
-    "xi-api-key": settings.ELEVEN_LABS_API_KEY
-  }
-  response = requests.get(f"https://api.elevenlabs.io/v1/voices/{voice_id}/settings", headers=headers)
+  cached_settings = cache.get(_voice_settings_cache_key(voice_id))
+  if cached_settings is not None:
+    return cached_settings
+
+  response = eleven_labs_client.get(f"/v1/voices/{voice_id}/settings", endpoint="voice-settings")
 
   if response.status_code == 200:
-      return response.json()
+      voice_settings = response.json()
+      cache.set(_voice_settings_cache_key(voice_id), voice_settings, settings.VOICE_SETTINGS_CACHE_TTL)
+      return voice_settings
   else:
     return {"error": "Failed to get voice settings", "status_code": response.status_code}
 
 
 def update_voice_settings(voice_id, stability, similarity_boost, style, use_speaker_boost):
-    headers = {
-        "xi-api-key": settings.ELEVEN_LABS_API_KEY,
-        "Content-Type": "application/json"
-    }
-    url = f"https://api.elevenlabs.io/v1/voices/{voice_id}/settings/edit"
+    path = f"/v1/voices/{voice_id}/settings/edit"
 
     payload = {
         "stability": stability,
@@ -117,8 +144,16 @@ def update_voice_settings(voice_id, stability, similarity_boost, style, use_spea
         "use_speaker_boost": use_speaker_boost
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    # Setting the same values twice has the same effect, so the call can be retried
+    response = eleven_labs_client.post(path, endpoint="voice-settings-edit", idempotent=True, json=payload)
 
     if response.status_code == 200:
+        # Write-through, so reading the settings back does not need another request
+        cache_key = _voice_settings_cache_key(voice_id)
+        cache.set(cache_key, {**(cache.get(cache_key) or {}), **payload}, settings.VOICE_SETTINGS_CACHE_TTL)
         return response.json()
-    return {"error": "Failed to update voice settings", "status_code": response.status_code}
\ No newline at end of file
+    return {"error": "Failed to update voice settings", "status_code": response.status_code}
+
+
+def _voice_settings_cache_key(voice_id):
+    return f"eleven_labs:voice_settings:{voice_id}"
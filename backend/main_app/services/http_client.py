@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class HTTPClient:
+    """
+    Pooled HTTP client for a single upstream API.
+
+    Connections are reused through one `requests.Session`, every request gets a connect/read
+    timeout, idempotent requests are retried with jittered exponential backoff and the latency
+    of each endpoint is recorded.
+    """
+
+    def __init__(self, base_url, headers=None, pool_maxsize=10, connect_timeout=3.05, read_timeout=30,
+                 max_retries=2, backoff=0.25):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def get(self, path, endpoint=None, **kwargs):
+        return self.request("GET", path, endpoint=endpoint, idempotent=True, **kwargs)
+
+    def post(self, path, endpoint=None, idempotent=False, **kwargs):
+        return self.request("POST", path, endpoint=endpoint, idempotent=idempotent, **kwargs)
+
+    def request(self, method, path, endpoint=None, idempotent=False, **kwargs):
+        """
+        Sends a request to `path` below the base URL. `endpoint` names the call in the latency stats.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = endpoint or path
+        attempts = self.max_retries + 1 if idempotent else 1
+
+        for attempt in range(attempts):
+            is_last_attempt = attempt == attempts - 1
+            started_at = time.perf_counter()
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(endpoint, started_at, failed=True)
+                if is_last_attempt:
+                    raise
+            else:
+                failed = response.status_code >= 400
+                self._record(endpoint, started_at, failed=failed)
+                if is_last_attempt or response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                response.close()
+
+            # Full jitter: spread the retries of concurrent workers
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get_stats(self):
+        """
+        Returns {endpoint: {"count", "errors", "avg_ms", "max_ms"}}; for streamed responses the
+        latency is the time until the response headers arrived.
+        """
+        with self._stats_lock:
+            return {
+                endpoint: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 1),
+                    "max_ms": round(stats["max_ms"], 1),
+                }
+                for endpoint, stats in self._stats.items()
+            }
+
+    def _record(self, endpoint, started_at, failed):
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["errors"] += int(failed)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
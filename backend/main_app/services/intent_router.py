@@ -0,0 +1,275 @@
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils.timezone import now
+
+from ..models import MainTask, Notification, Subtask
+from .assistant_run import iter_run_events
+from .task_counters import recompute_task_counters, record_subtasks
+from .thread_runs import add_message_to_idle_thread
+
+TaskTitle = namedtuple("TaskTitle", ("kind", "id", "main_task_id", "title", "main_task_title", "key"))
+
+POLITENESS = re.compile(r"^((please|hey|ok|okay|can you|could you|would you) )+|( please)+$")
+NEGATIONS = re.compile(
+    r"\b(not|never|no|dont|didnt|doesnt|havent|hasnt|hadnt|isnt|wasnt|arent|werent|cant|cannot|couldnt|wont|"
+    r"shouldnt|wouldnt|yet|undo|unmark|uncheck)\b"
+)
+TITLE_FILLERS = re.compile(r"^((the|my|a|task|subtask) )+|( (task|subtask|item))+$")
+
+# Rules over the normalized message (lower case, no punctuation), the first match decides
+INTENT_RULES = (
+    ("list_tasks", re.compile(
+        r"^(what are|show|show me|list|tell me|read|read me|give me)( all)? my (open |current |remaining )?"
+        r"(tasks|todos|to dos|to do list|todo list)$"
+    )),
+    ("list_tasks", re.compile(r"^(what do i (have|need) to do|whats on my (list|to do list|todo list))$")),
+    ("complete_task", re.compile(r"^(mark|set) (?P<title>.+?) as (done|complete|completed|finished)$")),
+    ("complete_task", re.compile(r"^(mark|set) (?P<title>.+?) (done|complete|completed|finished)$")),
+    ("complete_task", re.compile(r"^(complete|finish|check off|tick off|cross off) (?P<title>.+)$")),
+    ("complete_task", re.compile(r"^i (have |just )?(finished|completed) (?P<title>.+)$")),
+    ("complete_task", re.compile(r"^(?P<title>.+?) is (done|complete|completed|finished)$")),
+    ("delete_last_reminder", re.compile(
+        r"^(delete|remove|dismiss|clear) (the |my )?(last|latest|most recent|newest) (reminder|notification)$"
+    )),
+)
+
+
+class TaskTitleIndex:
+    """
+    In-memory index of the open task and subtask titles per user, least recently used users are dropped
+    beyond `max_users`. A user's titles are reloaded only when the count or the latest update of their
+    tasks and subtasks changed, which a single aggregate query tells.
+    """
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+
+        self._lock = threading.Lock()
+        self._titles = OrderedDict()  # user id -> (fingerprint, [TaskTitle]), least recently used first
+
+    def get(self, user):
+        fingerprint = _get_tasks_fingerprint(user)
+        with self._lock:
+            cached = self._titles.get(user.pk)
+            if cached is not None and cached[0] == fingerprint:
+                self._titles.move_to_end(user.pk)
+                return cached[1]
+
+        titles = _load_task_titles(user)
+        with self._lock:
+            self._titles[user.pk] = (fingerprint, titles)
+            self._titles.move_to_end(user.pk)
+            while len(self._titles) > self.max_users:
+                self._titles.popitem(last=False)
+        return titles
+
+
+class IntentRouter:
+    """
+    Answers simple commands ("mark buy milk as done", "what are my tasks", "delete the last reminder")
+    without an assistant run. A message is handled only if a rule matches it and, where it names a task,
+    exactly one open task or subtask title is similar enough (INTENT_ROUTER_MIN_SCORE, and at least
+    INTENT_ROUTER_MIN_MARGIN ahead of the next best one). Everything else goes to the assistant.
+
+    The exchange is added to the thread as a note so that the assistant keeps the context.
+    Must be called under thread_run_lock.
+    """
+
+    def __init__(self, max_users):
+        self.index = TaskTitleIndex(max_users)
+
+        self._lock = threading.Lock()
+        self._stats = {"messages": 0, "hits": 0, "unmatched": 0, "intents": {}}
+
+    def route(self, user, message):
+        """
+        Returns the reply if the message was handled, None if it is for the assistant.
+        """
+        if not settings.INTENT_ROUTER_ENABLED:
+            return None
+
+        started_at = time.perf_counter()
+        text = POLITENESS.sub("", normalize(message)).strip()
+
+        intent = reply = None
+        for rule_intent, pattern in INTENT_RULES:
+            match = pattern.match(text)
+            if match:
+                intent = rule_intent
+                reply = getattr(self, f"_{intent}")(user, match)
+                break
+
+        self._record(intent, reply is not None)
+        if reply is None:
+            return None
+
+        self._post_note(user, message, reply)
+        print(f"Intent router handled {intent} in {(time.perf_counter() - started_at) * 1000:.0f} ms")
+        return reply
+
+    def get_stats(self):
+        with self._lock:
+            messages = self._stats["messages"]
+            return {
+                **self._stats,
+                "intents": dict(self._stats["intents"]),
+                "hit_rate": round(self._stats["hits"] / messages, 3) if messages else None,
+            }
+
+    def _list_tasks(self, user, match):
+        titles = [task.title for task in self.index.get(user) if task.kind == "main_task"]
+        if not titles:
+            return "You have no open tasks."
+
+        limit = settings.INTENT_ROUTER_LIST_LIMIT
+        listed = titles[:limit] + ([f"{len(titles) - limit} more"] if len(titles) > limit else [])
+        listed = listed[0] if len(listed) == 1 else f"{', '.join(listed[:-1])} and {listed[-1]}"
+        return f"You have {len(titles)} open {'task' if len(titles) == 1 else 'tasks'}: {listed}."
+
+    def _complete_task(self, user, match):
+        # "i did not finish the report" or "mark the report as not done" must never complete it
+        if NEGATIONS.search(match.string):
+            return None
+
+        task = match_task_title(self.index.get(user), _get_title_key(match["title"]))
+        if task is None:
+            return None
+
+        with transaction.atomic():
+            if task.kind == "main_task":
+                # Same as completing it in the app: all subtasks are completed with it
+                if not MainTask.objects.filter(id=task.id, user=user, is_completed=False).update(
+                    is_completed=True, subtask_done=F("subtask_total"), updated_at=now()
+                ):
+                    return None
+                Subtask.objects.filter(main_task_id=task.id).update(is_completed=True, updated_at=now())
+                return f'Marked "{task.title}" as done.'
+
+            if not Subtask.objects.filter(id=task.id, main_task__user=user, is_completed=False).update(
+                is_completed=True, updated_at=now()
+            ):
+                return None
+            record_subtasks(task.main_task_id, completed=1)
+            MainTask.objects.filter(
+                id=task.main_task_id, is_completed=False, subtask_done=F("subtask_total")
+            ).update(is_completed=True, updated_at=now())
+        return f'Marked "{task.title}" of "{task.main_task_title}" as done.'
+
+    def _delete_last_reminder(self, user, match):
+        notification = (
+            Notification.objects.filter(user=user).select_related("main_task").order_by("-created_at", "-id").first()
+        )
+        if notification is None:
+            return "You have no reminders."
+
+        with transaction.atomic():
+            notification.delete()
+            recompute_task_counters(MainTask.objects.filter(id=notification.main_task_id))
+        return f'Deleted the last reminder, it was for "{notification.main_task.title}".'
+
+    def _post_note(self, user, message, reply):
+        note = f'{message}\n\n(The app already handled this message and replied: "{reply}" Nothing else is needed.)'
+        try:
+            add_message_to_idle_thread(user.thread_id, note)
+        except Exception as e:
+            # The command was carried out, only the assistant misses it
+            print(f"Could not add the intent router note to thread {user.thread_id}: {e}")
+
+    def _record(self, intent, hit):
+        with self._lock:
+            self._stats["messages"] += 1
+            if hit:
+                self._stats["hits"] += 1
+                self._stats["intents"][intent] = self._stats["intents"].get(intent, 0) + 1
+            elif intent is not None:
+                # A rule matched, but no task title was a confident match
+                self._stats["unmatched"] += 1
+
+
+def iter_answer_events(user, message):
+    """
+    Answers the message like `iter_run_events`, to be consumed under thread_run_lock. Commands handled
+    by the intent router yield their reply right away, everything else is added to the thread and run.
+    """
+    reply = intent_router.route(user, message)
+    if reply is not None:
+        yield "text_delta", reply
+        yield "completed", reply
+        return
+
+    add_message_to_idle_thread(user.thread_id, message)
+    yield from iter_run_events(user)
+
+
+def match_task_title(titles, query):
+    """
+    Returns the TaskTitle that is clearly the most similar to `query`, or None.
+    """
+    query = normalize(query)
+    matcher = SequenceMatcher(b=query)
+    best, best_score, runner_up_score = None, 0.0, 0.0
+
+    for task in titles:
+        matcher.set_seq1(task.key)
+        # The cheap upper bounds rule out most titles before the full comparison
+        if matcher.real_quick_ratio() <= runner_up_score or matcher.quick_ratio() <= runner_up_score:
+            continue
+
+        score = matcher.ratio()
+        if score > best_score:
+            best, best_score, runner_up_score = task, score, best_score
+        elif score > runner_up_score:
+            runner_up_score = score
+
+    if best_score < settings.INTENT_ROUTER_MIN_SCORE or best_score - runner_up_score < settings.INTENT_ROUTER_MIN_MARGIN:
+        return None
+    return best
+
+
+def _get_title_key(title):
+    # Messages with a negation are never matched, so negations are left out of the titles as well
+    return " ".join(TITLE_FILLERS.sub("", NEGATIONS.sub(" ", normalize(title))).split())
+
+
+def normalize(text):
+    text = text.lower().replace("'", "").replace("’", "")
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+def _get_tasks_fingerprint(user):
+    return tuple(MainTask.objects.filter(user=user).aggregate(
+        task_count=Count("id", distinct=True),
+        task_updated_at=Max("updated_at"),
+        subtask_count=Count("subtasks", distinct=True),
+        subtask_updated_at=Max("subtasks__updated_at"),
+    ).values())
+
+
+def _load_task_titles(user):
+    main_tasks = list(
+        MainTask.objects.filter(user=user, is_completed=False).order_by("-created_at", "-id").values_list("id", "title")
+    )
+    main_task_titles = dict(main_tasks)
+    subtasks = Subtask.objects.filter(main_task_id__in=main_task_titles, is_completed=False).values_list(
+        "id", "main_task_id", "title"
+    )
+
+    titles = [
+        TaskTitle("main_task", task_id, task_id, title, None, _get_title_key(title))
+        for task_id, title in main_tasks
+    ]
+    titles += [
+        TaskTitle("subtask", subtask_id, main_task_id, title, main_task_titles[main_task_id], _get_title_key(title))
+        for subtask_id, main_task_id, title in subtasks
+    ]
+    return titles
+
+
+intent_router = IntentRouter(settings.INTENT_ROUTER_INDEX_MAX_USERS)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .open_ai import create_assistant, modify_assistant_instruction
+from .jobs import enqueue_job
+from .thread_pool import get_thread_id, top_up_thread_pool
+from .thread_runs import reap_stale_runs
+
+
+def provision_assistant(user_id):
+    """
+    Creates whatever the user is still missing of their assistant and thread.
+    """
+    user = get_user_model().objects.select_related("voice_config").get(pk=user_id)
+    update_fields = []
+
+    if not user.assistant_id:
+        user.assistant_id = create_assistant(user).id
+        update_fields += ["assistant_id", "assistant_instructions_hash"]
+    if not user.thread_id:
+        user.thread_id = get_thread_id()
+        update_fields.append("thread_id")
+
+    if update_fields:
+        user.save(update_fields=update_fields)
+    return {"assistant_id": user.assistant_id, "thread_id": user.thread_id}
+
+
+def update_assistant_instruction(user_id):
+    user = get_user_model().objects.select_related("voice_config").get(pk=user_id)
+    if user.assistant_id:
+        modify_assistant_instruction(user)
+
+
+def run_thread_pool_top_up():
+    return {"created": top_up_thread_pool()}
+
+
+def run_stale_run_reaper():
+    """
+    Cancels stale assistant runs and schedules the next pass.
+    """
+    try:
+        return {"cancelled": reap_stale_runs()}
+    finally:
+        schedule_stale_run_reaper(delay=settings.THREAD_RUN_REAPER_INTERVAL)
+
+
+def schedule_stale_run_reaper(delay=0):
+    return enqueue_job("reap_stale_runs", key="reap_stale_runs", delay=delay)
+
+
+# Background jobs by kind, run by services/jobs.py
+JOB_HANDLERS = {
+    "provision_assistant": provision_assistant,
+    "update_assistant_instruction": update_assistant_instruction,
+    "top_up_thread_pool": run_thread_pool_top_up,
+    "reap_stale_runs": run_stale_run_reaper,
+}
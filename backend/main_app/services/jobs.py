@@ -0,0 +1,154 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from ..models import Job
+
+
+def enqueue_job(kind, payload=None, key=None, delay=0):
+    """
+    Adds a job for the `run_jobs` worker. If a pending job with the same `key` exists,
+    that job is returned instead of enqueuing a second one.
+
+    Called inside a transaction the job is only visible to the worker once it commits.
+    """
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                kind=kind,
+                payload=payload or {},
+                key=key,
+                run_at=now() + timedelta(seconds=delay),
+                max_attempts=settings.JOB_MAX_ATTEMPTS,
+            )
+    except IntegrityError:
+        existing_job = Job.objects.filter(key=key, status=Job.PENDING).first()
+        if existing_job is None:
+            # The pending job was claimed in the meantime, the new state still needs a run
+            return enqueue_job(kind, payload, key, delay)
+        return existing_job
+
+
+def claim_jobs(limit=1, job_id=None):
+    """
+    Marks up to `limit` runnable jobs as running for this worker and returns them.
+
+    Runnable are pending jobs that are due and running jobs whose visibility timeout expired
+    (their worker died). On Postgres the rows are locked with SKIP LOCKED so that workers never
+    wait for each other; elsewhere (SQLite) a job is only claimed if nobody changed it since it was read.
+    """
+    current_time = now()
+    runnable = Job.objects.filter(
+        Q(status=Job.PENDING, run_at__lte=current_time)
+        | Q(status=Job.RUNNING, locked_until__lt=current_time)
+    )
+    if job_id is not None:
+        runnable = runnable.filter(pk=job_id)
+
+    claimed = []
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            runnable = runnable.select_for_update(skip_locked=True)
+
+        for job in runnable.order_by("run_at", "id")[:limit]:
+            if job.attempts >= job.max_attempts:
+                # Timed out on its last attempt
+                _finish(job, Job.FAILED, last_error=job.last_error or "Visibility timeout expired")
+                continue
+
+            is_claimed = Job.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+                status=Job.RUNNING,
+                attempts=F("attempts") + 1,
+                locked_until=current_time + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+                updated_at=current_time,
+            )
+            if is_claimed:
+                job.refresh_from_db()
+                claimed.append(job)
+
+    return claimed
+
+
+def run_job(job):
+    """
+    Runs a claimed job. Failed jobs are retried with exponential backoff until max_attempts is reached.
+    """
+    # The handlers use services that enqueue jobs themselves, so they can only be imported here
+    from .job_handlers import JOB_HANDLERS
+
+    started_at = time.perf_counter()
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        result = handler(**job.payload)
+    except Exception as e:
+        print(f"Job {job.pk} ({job.kind}) failed on attempt {job.attempts}: {e}")
+        last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            _finish(job, Job.FAILED, last_error=last_error)
+        else:
+            retry_delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            try:
+                with transaction.atomic():
+                    _finish(job, Job.PENDING, last_error=last_error, run_at=now() + timedelta(seconds=retry_delay))
+            except IntegrityError:
+                # A newer pending job with the same key was enqueued meanwhile and replaces the retry
+                _finish(job, Job.FAILED, last_error=f"Superseded by a newer job\n{last_error}")
+    else:
+        _finish(job, Job.DONE, result=result)
+        print(f"Job {job.pk} ({job.kind}) took {(time.perf_counter() - started_at) * 1000:.0f} ms")
+
+
+def wait_for_job(job, timeout=None):
+    """
+    Waits until `job` is done and returns its result. A job that no worker has picked up yet is
+    run in this process, so callers do not depend on a worker being idle.
+
+    Raises RuntimeError if the job failed, also if the attempt made here or the previous attempt failed
+    (retries are left to the worker then), and TimeoutError if it is not done within `timeout` seconds.
+    """
+    deadline = time.monotonic() + (timeout or settings.JOB_WAIT_TIMEOUT)
+    delay = 0.1
+
+    while True:
+        job.refresh_from_db()
+        if job.status == Job.DONE:
+            return job.result
+        if job.status == Job.FAILED:
+            raise RuntimeError(f"Job {job.pk} ({job.kind}) failed: {_get_error(job)}")
+        if job.status == Job.PENDING and job.attempts and job.run_at > now():
+            # Waiting out the retry backoff would likely end in the same error
+            raise RuntimeError(f"Job {job.pk} ({job.kind}) failed: {_get_error(job)}")
+
+        claimed_jobs = claim_jobs(job_id=job.pk)
+        if claimed_jobs:
+            run_job(claimed_jobs[0])
+            job.refresh_from_db()
+            if job.status != Job.DONE:
+                raise RuntimeError(f"Job {job.pk} ({job.kind}) failed: {_get_error(job)}")
+            return job.result
+
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Job {job.pk} ({job.kind}) did not finish in time")
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+def _get_error(job):
+    # The stored error is the whole traceback, its last line names the exception
+    error = (job.last_error or "").strip().splitlines()[-1:]
+    return error[0] if error else "unknown error"
+
+
+def _finish(job, status, **fields):
+    # A job whose visibility timeout expired may have been claimed again, only its current owner writes it
+    Job.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+        status=status,
+        locked_until=None,
+        updated_at=now(),
+        **fields,
+    )
@@ -1,11 +1,14 @@
 from datetime import timedelta
 import pytz
-import io
 import json
-import os
-import subprocess
+import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
 from django.utils.timezone import now, localtime
 from django.utils.dateparse import parse_datetime
 
@@ -13,9 +16,16 @@ from ..serializers import MainTaskSerializer, NotificationSerializer
 
 from ..models import MainTask, Subtask, Notification
 
-from .assistant_instructions import generate_instructions
+from .audio_preprocessing import preprocess_audio
+from .assistant_instructions import TTM_STAGES, generate_instructions, get_instructions_hash
+from .jobs import enqueue_job
+from .task_counters import record_reminders
 
 client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+# Durations of the tool calls by tool name, see get_tool_stats
+_tool_stats_lock = threading.Lock()
+_tool_stats = {}
     
 def fetch_openai_response(context):
     try:
@@ -29,24 +39,48 @@ def fetch_openai_response(context):
     
 
 def convert_audio_to_text(audio_file):
-    try:
-        with open("test.wav", "wb") as buffer:
-            buffer.write(audio_file.file.read())
-
-        audio_input = open("test.wav", "rb")
+    """
+    Transcribes an uploaded audio file.
 
-        response = client.audio.transcriptions.create(
-            file=audio_input,
-            model="whisper-1"
-        )
+    The upload is downmixed, resampled, trimmed and compressed first if that makes it smaller, and
+    long recordings are split at pauses and the segments transcribed concurrently. Otherwise it is
+    streamed to OpenAI from wherever Django keeps it (in memory for small uploads, a per-request
+    temporary file for large ones), so concurrent requests never share a file.
+    """
+    try:
+        segments = preprocess_audio(audio_file) if settings.AUDIO_PREPROCESSING else None
+        if not segments:
+            filename = audio_file.name or "audio.wav"
+            content_type = audio_file.content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            return transcribe_audio(filename, audio_file.file, content_type)
 
-        os.remove("test.wav")
-        return response.text
-    except subprocess.CalledProcessError as e:
-        return f"Error during file conversion: {e.stderr.decode()}"
+        return transcribe_segments(segments)
     except Exception as e:
         return f"Error while fetching response from OpenAI: {str(e)}"
+
+def transcribe_segments(segments):
+    """
+    Transcribes PreprocessedAudio segments concurrently and joins their texts in order.
+    """
+    if len(segments) == 1:
+        return transcribe_audio(segments[0].filename, segments[0].data, segments[0].content_type)
+
+    max_workers = min(len(segments), settings.TRANSCRIPTION_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        texts = list(executor.map(
+            lambda segment: transcribe_audio(segment.filename, segment.data, segment.content_type),
+            segments,
+        ))
+    return " ".join(text.strip() for text in texts if text.strip())
+
+def transcribe_audio(filename, content, content_type):
+    response = client.audio.transcriptions.create(
+        file=(filename, content, content_type),
+        model="whisper-1"
+    )
+    return response.text
     
+
 def create_assistant(user):
     instructions = generate_instructions(user)
 
@@ -135,7 +169,16 @@ def create_assistant(user):
                 "type": "function",
                 "function": {
                     "name": "check_due_date_tasks",
-                    "description": "Fetch tasks that are due soon for reminders"
+                    "description": "Fetch tasks that are overdue or due soon for reminders",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "horizon_days": {
+                                "type": "integer",
+                                "description": "How many days ahead to look for due tasks"
+                            }
+                        }
+                    }
                 }
             },
             {
@@ -175,6 +218,7 @@ def create_assistant(user):
                         "properties": {
                             "ttm_stage": {
                                 "type": "string",
+                                "enum": list(TTM_STAGES),
                                 "description": "New TTM stage for the user if he deserves to change it."
                             }
                         },
@@ -184,200 +228,313 @@ def create_assistant(user):
             },
         ]
     )
+    user.assistant_instructions_hash = get_instructions_hash(instructions)
     return assistant # Save afterwards
 
 def modify_assistant_instruction(user):
-    assistant_id = user.assistant_id
+    """
+    Pushes the user's instructions to their assistant unless the assistant already has them.
+    Returns whether the assistant was updated.
+    """
     instructions = generate_instructions(user)
-    assistant = client.beta.assistants.update(
-        assistant_id,
+    instructions_hash = get_instructions_hash(instructions)
+    if instructions_hash == user.assistant_instructions_hash:
+        return False
+
+    client.beta.assistants.update(
+        user.assistant_id,
         instructions=instructions
     )
+    user.assistant_instructions_hash = instructions_hash
+    user.save(update_fields=["assistant_instructions_hash"])
+    return True
+
+def schedule_assistant_instruction_update(user):
+    """
+    Enqueues an update of the assistant instructions, so that the request (or the run that
+    triggered it) does not wait for OpenAI.
+    """
+    enqueue_job("update_assistant_instruction", {"user_id": user.pk}, key=f"update_assistant_instruction:{user.pk}")
+
+def schedule_assistant_provisioning(user):
+    """
+    Enqueues the creation of the user's assistant and thread and returns the job.
+    """
+    return enqueue_job("provision_assistant", {"user_id": user.pk}, key=f"provision_assistant:{user.pk}")
+
 
 def handle_function_calling(run, user):
     """
     Handles the required actions from the assistant.
     """
-    tool_outputs = []
-
-    for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-        # IF add_task WAS CALLED BY AI
-        if tool_call.function.name == "add_task":
-            # Save task to MainTask
-            arguments = json.loads(tool_call.function.arguments)
-            task_title = arguments["task"]
-            task_description = arguments["description"] if "description" in arguments else None
-            task_due_date = arguments["due_date"] if "due_date" in arguments else None
-
-            if task_due_date:
-                user_timezone = pytz.timezone(user.time_zone if user.time_zone else "Europe/Berlin")
-                localized_due_date = user_timezone.localize(parse_datetime(task_due_date)).astimezone(pytz.UTC)
-            else:
-                localized_due_date = None
-
-            task_data = MainTask.objects.create(
-                user=user,
-                title=task_title,
-                description=task_description,
-                due_date=localized_due_date
-            )
+    tool_outputs = get_tool_outputs(run.required_action.submit_tool_outputs.tool_calls, user)
 
-            serialized_task = MainTaskSerializer(task_data).data
-
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({"status": "success", "task": serialized_task})
-            })
-        # IF add_decomposed_task WAS CALLED BY AI
-        elif tool_call.function.name == "add_decomposed_task":
-            # Save decomposed tasks
-            arguments = json.loads(tool_call.function.arguments)
-            main_task_title = arguments["main_task"]
-            subtasks_titles = arguments["subtasks"]
-            subtasks = []
-
-            main_task = MainTask.objects.create(
-                user=user,
-                title=main_task_title,
-            )
+    if tool_outputs:
+        submit_tool_outputs(run.thread_id, run.id, tool_outputs)
 
-            for subtask_title in subtasks_titles:
-                subtasks.append(Subtask.objects.create(
-                    main_task=main_task,
-                    title=subtask_title,
-                ))
-
-            serialized_main_task = MainTaskSerializer(main_task).data
-            serialized_subtasks = [{"id": subtask.id, "title": subtask.title} for subtask in subtasks]
-
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({
-                    "status": "success",
-                    "main_task": serialized_main_task,
-                    "subtasks": serialized_subtasks,
-                })
-            })
-
-        # IF get_tasks WAS CALLED BY AI
-        elif tool_call.function.name == "get_tasks":
-            print("I was in the get_tasks function")
-            arguments = json.loads(tool_call.function.arguments)
-            include_completed = arguments["include_completed"]
-            if include_completed:
-                tasks = MainTask.objects.filter(user=user).prefetch_related("subtasks").order_by("-created_at")
-            else:
-                tasks = MainTask.objects.filter(user=user, is_completed=False).prefetch_related("subtasks").order_by("-created_at")
-
-            tasks_data = MainTaskSerializer(tasks, many=True).data
-
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({"status": "success", "tasks": tasks_data}),
-            })
-
-        # IF check_due_date_tasks WAS CALLED BY AI
-        elif tool_call.function.name == "check_due_date_tasks":
-            print("I was in the check_due_date_tasks function")
-
-            user_timezone = pytz.timezone(user.time_zone if user.time_zone else "Europe/Berlin")
-
-            upcoming_tasks = MainTask.objects.filter(
+def get_tool_outputs(tool_calls, user):
+    """
+    Executes the tool calls requested by the assistant and returns their outputs in tool call order.
+
+    Read-only tools run concurrently in a thread pool. Mutating tools run one after another,
+    in the order the assistant requested them, inside a single transaction.
+    """
+    outputs = {}
+    read_only_calls = [tool_call for tool_call in tool_calls if tool_call.function.name in READ_ONLY_TOOLS]
+    mutating_calls = [tool_call for tool_call in tool_calls if tool_call.function.name not in READ_ONLY_TOOLS]
+
+    if len(read_only_calls) > 1:
+        with ThreadPoolExecutor(max_workers=settings.TOOL_EXECUTOR_MAX_WORKERS) as executor:
+            futures = {
+                tool_call.id: executor.submit(_execute_tool_call_in_thread, tool_call, user)
+                for tool_call in read_only_calls
+            }
+            for tool_call_id, future in futures.items():
+                outputs[tool_call_id] = future.result()
+    else:
+        for tool_call in read_only_calls:
+            outputs[tool_call.id] = execute_tool_call(tool_call, user)
+
+    if mutating_calls:
+        with transaction.atomic():
+            for tool_call in mutating_calls:
+                outputs[tool_call.id] = execute_tool_call(tool_call, user)
+
+    return [
+        {"tool_call_id": tool_call.id, "output": json.dumps(outputs[tool_call.id])}
+        for tool_call in tool_calls
+    ]
+
+def execute_tool_call(tool_call, user):
+    """
+    Runs a single tool call and records how long it took.
+    """
+    tool_name = tool_call.function.name
+    tool_handler = TOOL_HANDLERS.get(tool_name)
+    if tool_handler is None:
+        return {"status": "error", "message": f"Unknown function {tool_name}"}
+
+    arguments = json.loads(tool_call.function.arguments or "{}")
+
+    started_at = time.perf_counter()
+    try:
+        output = tool_handler(user, arguments)
+    except Exception:
+        _record_tool_duration(tool_name, started_at, failed=True)
+        raise
+    elapsed_ms = _record_tool_duration(tool_name, started_at, failed=False)
+    print(f"Tool {tool_name} took {elapsed_ms:.1f} ms")
+
+    return output
+
+def get_tool_stats():
+    """
+    Returns {tool name: {"count", "errors", "avg_ms", "max_ms"}} for the tool calls of this process.
+    """
+    with _tool_stats_lock:
+        return {
+            tool_name: {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+            }
+            for tool_name, stats in _tool_stats.items()
+        }
+
+def _record_tool_duration(tool_name, started_at, failed):
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    with _tool_stats_lock:
+        stats = _tool_stats.setdefault(tool_name, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["count"] += 1
+        stats["errors"] += int(failed)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    return elapsed_ms
+
+def _execute_tool_call_in_thread(tool_call, user):
+    try:
+        return execute_tool_call(tool_call, user)
+    finally:
+        # Every worker thread opens its own database connection
+        connection.close()
+
+def add_task(user, arguments):
+    # Save task to MainTask
+    task_title = arguments["task"]
+    task_description = arguments["description"] if "description" in arguments else None
+    task_due_date = arguments["due_date"] if "due_date" in arguments else None
+
+    if task_due_date:
+        user_timezone = pytz.timezone(user.time_zone if user.time_zone else "Europe/Berlin")
+        localized_due_date = user_timezone.localize(parse_datetime(task_due_date)).astimezone(pytz.UTC)
+    else:
+        localized_due_date = None
+
+    task_data = MainTask.objects.create(
+        user=user,
+        title=task_title,
+        description=task_description,
+        due_date=localized_due_date
+    )
+
+    serialized_task = MainTaskSerializer(task_data).data
+
+    return {"status": "success", "task": serialized_task}
+
+def add_decomposed_task(user, arguments):
+    # Save decomposed tasks
+    main_task_title = arguments["main_task"]
+    subtasks_titles = arguments["subtasks"]
+
+    # The task tree is created as a whole or not at all
+    with transaction.atomic(savepoint=False):
+        main_task = MainTask.objects.create(
+            user=user,
+            title=main_task_title,
+            subtask_total=len(subtasks_titles),
+        )
+
+        subtasks = Subtask.objects.bulk_create([
+            Subtask(main_task=main_task, title=subtask_title)
+            for subtask_title in subtasks_titles
+        ])
+
+    serialized_main_task = MainTaskSerializer(main_task).data
+    serialized_subtasks = [{"id": subtask.id, "title": subtask.title} for subtask in subtasks]
+
+    return {
+        "status": "success",
+        "main_task": serialized_main_task,
+        "subtasks": serialized_subtasks,
+    }
+
+def get_tasks(user, arguments):
+    print("I was in the get_tasks function")
+    include_completed = arguments["include_completed"]
+    if include_completed:
+        tasks = MainTask.objects.filter(user=user).prefetch_related("subtasks").order_by("-created_at")
+    else:
+        tasks = MainTask.objects.filter(user=user, is_completed=False).prefetch_related("subtasks").order_by("-created_at")
+
+    tasks_data = MainTaskSerializer(tasks, many=True).data
+
+    return {"status": "success", "tasks": tasks_data}
+
+def check_due_date_tasks(user, arguments):
+    print("I was in the check_due_date_tasks function")
+
+    user_timezone = pytz.timezone(user.time_zone if user.time_zone else "Europe/Berlin")
+    horizon_days = arguments.get("horizon_days") or settings.DUE_DATE_TASKS_HORIZON_DAYS
+
+    # Incomplete tasks that are overdue or due within the horizon, together with their notifications
+    upcoming_tasks = (
+        MainTask.objects.filter(
+            user=user,
+            is_completed=False,
+            due_date__lte=now() + timedelta(days=horizon_days),
+        )
+        .prefetch_related("subtasks", Prefetch("MainTask", queryset=Notification.objects.order_by("created_at")))
+        .order_by("due_date")[:settings.DUE_DATE_TASKS_MAX_ROWS]
+    )
+
+    serialized_tasks = []
+    for task in upcoming_tasks.iterator(chunk_size=settings.DUE_DATE_TASKS_CHUNK_SIZE):
+        serialized_task = MainTaskSerializer(task).data
+        serialized_task["you_have_reminded_count"] = task.reminders_sent
+        serialized_task["notifications"] = NotificationSerializer(task.MainTask.all(), many=True).data
+        serialized_task["due_date"] = localtime(task.due_date, user_timezone).strftime("%Y-%m-%d %H:%M:%S %Z")
+        serialized_tasks.append(serialized_task)
+
+    return {
+        "status": "success",
+        "tasks": serialized_tasks,
+    }
+
+def create_notifications(user, arguments):
+    print("I was in the create notifications function")
+    task_ids = list(dict.fromkeys(int(task_id) for task_id in arguments["task_ids"]))
+
+    with transaction.atomic(savepoint=False):
+        # Ownership check and current reminder counters in a single query, unknown ids are skipped
+        tasks = MainTask.objects.filter(id__in=task_ids, user=user).select_for_update()
+        tasks_by_id = {task.id: task for task in tasks}
+
+        new_notifications = [
+            Notification(
                 user=user,
-                # due_date__gte=now(), # due_date >= now
-                # due_date__lte=now() + timedelta(days=2), # due_date <= now + 1 day
-                # # => due_date between now and now + 1 day
-                is_completed=False
+                main_task=tasks_by_id[task_id],
+                reminder_count=tasks_by_id[task_id].reminders_sent + 1
             )
+            for task_id in task_ids if task_id in tasks_by_id
+        ]
 
-            serialized_tasks = MainTaskSerializer(upcoming_tasks, many=True).data
-
-            for task in serialized_tasks:
-                task_id = task["id"]
-                task["you_have_reminded_count"] = Notification.objects.filter(main_task_id=task_id).count()
-                task["notifications"] = NotificationSerializer(Notification.objects.filter(main_task_id=task_id), many=True).data
-                
-                if task["due_date"]:
-                    due_date_dt = parse_datetime(task["due_date"])
-                    
-                    if due_date_dt and due_date_dt.tzinfo is None:
-                        due_date_dt = due_date_dt.replace(tzinfo=pytz.UTC)
-                    
-                    task["due_date"] = localtime(due_date_dt, user_timezone).strftime("%Y-%m-%d %H:%M:%S %Z")
-            
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({
-                    "status": "success",
-                    "tasks": serialized_tasks,
-                })
-            })
-        
-        # IF create_notifications WAS CALLED BY AI
-        elif tool_call.function.name == "create_notifications":
-            print("I was in the create notifications function")
-            arguments = json.loads(tool_call.function.arguments)
-            task_ids = arguments["task_ids"]
-
-            notifications = []
-            for task_id in task_ids:
-                try:
-                    task = MainTask.objects.get(id=task_id, user=user)
-                    reminder_count = Notification.objects.filter(main_task=task).count()
-
-                    Notification.objects.create(
-                        user=user,
-                        main_task=task,
-                        reminder_count=reminder_count + 1
-                    )
-
-                    notifications.append({"task_id": task_id, "reminder_count": reminder_count + 1})
-                except MainTask.DoesNotExist:
-                    continue
+        Notification.objects.bulk_create(new_notifications)
+        record_reminders(list(tasks_by_id), now())
 
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({
-                    "status": "success",
-                    "created_notifications": notifications,
-                })
-            })
+    notifications = [
+        {"task_id": notification.main_task_id, "reminder_count": notification.reminder_count}
+        for notification in new_notifications
+    ]
 
-        # IF update_user_ttm_stage WAS CALLED BY AI
-        elif tool_call.function.name == "update_user_ttm_stage":
-            print("I was in the update_user_ttm_stage function")
-            arguments = json.loads(tool_call.function.arguments)
-            ttm_stage = arguments["ttm_stage"]
+    return {
+        "status": "success",
+        "created_notifications": notifications,
+    }
 
-            user.voice_config.ttm_stage = ttm_stage
-            user.voice_config.save()
+def update_user_ttm_stage(user, arguments):
+    print("I was in the update_user_ttm_stage function")
+    ttm_stage = _get_ttm_stage(arguments.get("ttm_stage"))
+    if ttm_stage is None:
+        # A stage the instructions don't know would break every later instruction update of the user
+        return {
+            "status": "error",
+            "message": f"Unknown TTM stage {arguments.get('ttm_stage')!r}, it must be one of {', '.join(TTM_STAGES)}",
+        }
 
-            modify_assistant_instruction(user)
+    user.ttm_stage = ttm_stage
+    user.save(update_fields=["ttm_stage"])
 
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({"status": "success", "current_user_ttm_stage": ttm_stage}),
-            })
+    schedule_assistant_instruction_update(user)
 
-        elif tool_call.function.name == "get_current_date_time":
-            print("I was in the get_current_date_time function")
+    return {"status": "success", "current_user_ttm_stage": ttm_stage}
 
-            user_timezone = pytz.timezone(user.time_zone if user.time_zone else "Europe/Berlin")
-            date_time = localtime(now(), user_timezone).strftime("%Y-%m-%d %H:%M:%S %Z")
+def _get_ttm_stage(value):
+    """
+    Returns the TTM_STAGES key for a stage name given by the model ("action", "Action stage"), or None.
+    """
+    if not isinstance(value, str):
+        return None
+    name = " ".join(value.split()).lower().removesuffix(" stage")
+    return next((stage for stage in TTM_STAGES if stage.lower() == name), None)
 
-            tool_outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps({"status": "success", "date_time": date_time}),
-            })
+def get_current_date_time(user, arguments):
+    print("I was in the get_current_date_time function")
 
+    user_timezone = pytz.timezone(user.time_zone if user.time_zone else "Europe/Berlin")
+    date_time = localtime(now(), user_timezone).strftime("%Y-%m-%d %H:%M:%S %Z")
 
+    return {"status": "success", "date_time": date_time}
 
-    if tool_outputs:
-        submit_tool_outputs(run.thread_id, run.id, tool_outputs)
+TOOL_HANDLERS = {
+    "add_task": add_task,
+    "add_decomposed_task": add_decomposed_task,
+    "get_tasks": get_tasks,
+    "check_due_date_tasks": check_due_date_tasks,
+    "create_notifications": create_notifications,
+    "update_user_ttm_stage": update_user_ttm_stage,
+    "get_current_date_time": get_current_date_time,
+}
+
+# Tools that only read from the database and can safely run concurrently
+READ_ONLY_TOOLS = {"get_tasks", "check_due_date_tasks", "get_current_date_time"}
 
 def create_thread():
     return client.beta.threads.create() # Save afterwards
 
+def delete_thread(thread_id):
+    return client.beta.threads.delete(thread_id)
+
 def add_message_to_thread(thread_id, message_body):
     message = client.beta.threads.messages.create(
         thread_id=thread_id,
@@ -412,17 +569,26 @@ def submit_tool_outputs(thread_id, run_id, tool_outputs):
     )
     return run
     
-def cancel_active_run(thread_id):
+# Runs in these states keep the thread from accepting new messages and runs
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action")
+ACTIVE_RUN_LOOKUP_LIMIT = 5
+
+def cancel_active_run(thread_id, started_before=None):
         """
-        Cancels the active run for the given thread_id.
+        Cancels the active runs of the given thread_id, if `started_before` (a Unix timestamp) is given
+        only those created before it. Returns the cancelled runs.
         """
+        cancelled_runs = []
         try:
-            # Get active runs for the thread
-            active_runs = client.beta.threads.runs.list(thread_id=thread_id)
-            for run in active_runs.data:
-                if run.status != "completed":
-                    # Cancel the active run
-                    client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
-                    print(f"Cancelled active run: {run.id}")
+            # Runs are listed newest first and an active run is always among the latest ones
+            runs = client.beta.threads.runs.list(thread_id=thread_id, order="desc", limit=ACTIVE_RUN_LOOKUP_LIMIT)
+            for run in runs.data:
+                if run.status not in ACTIVE_RUN_STATUSES:
+                    continue
+                if started_before is not None and run.created_at >= started_before:
+                    continue
+                cancelled_runs.append(client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id))
+                print(f"Cancelled active run: {run.id}")
         except Exception as e:
-            print(f"Error while canceling active run: {e}")
\ No newline at end of file
+            print(f"Error while canceling active run: {e}")
+        return cancelled_runs
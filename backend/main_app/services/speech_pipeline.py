@@ -0,0 +1,75 @@
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .eleven_labs import convert_text_to_speech
+
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+
+def iter_sentences(text_deltas, min_chars=0):
+    """
+    Joins streamed text deltas and yields them back sentence by sentence.
+    Sentences shorter than `min_chars` are merged with the following one.
+    """
+    buffer = ""
+    for delta in text_deltas:
+        buffer += delta
+
+        match = SENTENCE_END.search(buffer, min_chars)
+        while match:
+            sentence, buffer = buffer[:match.end()].strip(), buffer[match.end():]
+            yield sentence
+            match = SENTENCE_END.search(buffer, min_chars)
+
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class SentenceSpeechPipeline:
+    """
+    Synthesizes speech for the assistant reply sentence by sentence while the run is still streaming.
+
+    Sentences are sent to ElevenLabs concurrently (at most `max_workers` in flight) and the audio
+    segments are yielded in sentence order. The full reply text is available as `response_text`
+    once the pipeline has been consumed.
+    """
+
+    def __init__(self, user, max_workers=None, min_sentence_chars=None):
+        self.user = user
+        self.max_workers = max_workers or settings.TTS_PIPELINE_MAX_WORKERS
+        self.min_sentence_chars = min_sentence_chars or settings.TTS_PIPELINE_MIN_SENTENCE_CHARS
+        self.response_text = ""
+
+    def run(self, run_events):
+        """
+        Consumes `iter_run_events` output and yields the audio segments in order.
+        """
+        # Load the voice config once, the worker threads must not query the database
+        self.user.voice_config
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for sentence in iter_sentences(self._iter_text_deltas(run_events), self.min_sentence_chars):
+                pending.append(executor.submit(convert_text_to_speech, self.user, sentence))
+
+                while pending and (pending[0].done() or len(pending) >= self.max_workers):
+                    yield self._get_audio(pending.popleft())
+
+            while pending:
+                yield self._get_audio(pending.popleft())
+
+    def _iter_text_deltas(self, run_events):
+        for event_type, payload in run_events:
+            if event_type == "text_delta":
+                yield payload
+            elif event_type == "completed":
+                self.response_text = payload
+
+    def _get_audio(self, future):
+        audio = future.result()
+        if not isinstance(audio, bytes):
+            raise ValueError(audio or "Failed to generate audio response")
+        return audio
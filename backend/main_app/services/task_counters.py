@@ -0,0 +1,44 @@
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..models import MainTask, Notification, Subtask
+
+
+def record_reminders(task_ids, reminded_at):
+    """
+    Counts one more reminder for each of the tasks.
+    """
+    MainTask.objects.filter(id__in=task_ids).update(
+        reminders_sent=F("reminders_sent") + 1,
+        last_reminded_at=reminded_at,
+    )
+
+
+def record_subtasks(task_id, added=0, completed=0):
+    """
+    Adjusts the subtask counters of a task by the given deltas.
+    """
+    MainTask.objects.filter(id=task_id).update(
+        subtask_total=F("subtask_total") + added,
+        subtask_done=F("subtask_done") + completed,
+    )
+
+
+def recompute_task_counters(tasks):
+    """
+    Recomputes the counters of the given MainTask queryset from the notification and subtask
+    tables in a single UPDATE.
+    """
+    notifications = Notification.objects.filter(main_task=OuterRef("pk")).order_by().values("main_task")
+    subtasks = Subtask.objects.filter(main_task=OuterRef("pk")).order_by().values("main_task")
+
+    return tasks.update(
+        reminders_sent=_count_subquery(notifications.annotate(value=Count("id"))),
+        last_reminded_at=Subquery(notifications.annotate(value=Max("created_at")).values("value")),
+        subtask_total=_count_subquery(subtasks.annotate(value=Count("id"))),
+        subtask_done=_count_subquery(subtasks.annotate(value=Count("id", filter=Q(is_completed=True)))),
+    )
+
+
+def _count_subquery(queryset):
+    return Coalesce(Subquery(queryset.values("value"), output_field=IntegerField()), Value(0))
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from ..models import PooledThread
+from .jobs import enqueue_job
+from .open_ai import create_thread, delete_thread
+
+
+def get_thread_id():
+    """
+    Returns the id of a pre-created thread from the pool, or of a new thread if the pool is empty.
+    Either way a top-up is scheduled.
+    """
+    thread_id = claim_thread()
+    schedule_thread_pool_top_up()
+    if thread_id is None:
+        print("Thread pool is empty, creating a thread")
+        return create_thread().id
+    return thread_id
+
+
+def schedule_thread_pool_top_up():
+    return enqueue_job("top_up_thread_pool", key="top_up_thread_pool")
+
+
+def claim_thread():
+    """
+    Removes one thread from the pool and returns its id, or None if the pool is empty.
+    """
+    threads = PooledThread.objects.filter(created_at__gte=_get_oldest_usable()).order_by("created_at")
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            threads = threads.select_for_update(skip_locked=True)
+
+        # Without row locks (SQLite) another request may take the same thread first, then try the next one
+        for pooled_thread in threads[:5]:
+            deleted, _ = PooledThread.objects.filter(pk=pooled_thread.pk).delete()
+            if deleted:
+                return pooled_thread.thread_id
+
+    return None
+
+
+def release_thread(thread_id):
+    """
+    Puts a claimed but unused thread back into the pool.
+    """
+    PooledThread.objects.get_or_create(thread_id=thread_id)
+
+
+def top_up_thread_pool(size=None):
+    """
+    Deletes threads older than THREAD_POOL_MAX_AGE and creates threads until the pool holds `size` of them.
+    Returns the number of threads created.
+
+    Top-ups may run concurrently (a new one can be enqueued while another is running), so each thread
+    is only added if the pool is still short of it; a thread that is not needed anymore is deleted again.
+    """
+    size = settings.THREAD_POOL_SIZE if size is None else size
+    _delete_expired_threads()
+
+    created = 0
+    while PooledThread.objects.count() < size:
+        thread_id = create_thread().id
+        if not _add_to_pool(thread_id, size):
+            delete_thread(thread_id)
+            break
+        created += 1
+    return created
+
+
+def _add_to_pool(thread_id, size):
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Serializes the check and the insert with concurrent top-ups, claims wait for it only briefly
+            table = connection.ops.quote_name(PooledThread._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+
+        if PooledThread.objects.count() >= size:
+            return False
+        PooledThread.objects.create(thread_id=thread_id)
+        return True
+
+
+def _delete_expired_threads():
+    for pooled_thread in PooledThread.objects.filter(created_at__lt=_get_oldest_usable()):
+        # Only the worker whose delete removed the row deletes the thread
+        deleted, _ = PooledThread.objects.filter(pk=pooled_thread.pk).delete()
+        if not deleted:
+            continue
+        try:
+            delete_thread(pooled_thread.thread_id)
+        except Exception as e:
+            print(f"Error while deleting expired pool thread {pooled_thread.thread_id}: {e}")
+
+
+def _get_oldest_usable():
+    return now() - timedelta(seconds=settings.THREAD_POOL_MAX_AGE)
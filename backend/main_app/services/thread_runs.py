@@ -0,0 +1,99 @@
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.utils.timezone import now
+from openai import BadRequestError
+
+from .open_ai import add_message_to_thread, cancel_active_run, retrieve_current_run
+
+
+class ThreadBusyError(Exception):
+    """
+    Raised when the user's thread stays busy with another run for longer than THREAD_RUN_WAIT_SECONDS.
+    """
+
+
+@contextmanager
+def thread_run_lock(user, wait=True):
+    """
+    Serializes the assistant runs on the user's thread, since OpenAI rejects messages and runs
+    while another run is active. Concurrent requests wait for the lock with a backoff for up to
+    THREAD_RUN_WAIT_SECONDS (not at all with `wait=False`) and then raise ThreadBusyError.
+
+    The lock is a lease on the user row: it expires after the run deadline plus THREAD_RUN_LOCK_MARGIN,
+    so a worker that dies while holding it blocks the thread for a bounded time only.
+    """
+    token = uuid.uuid4().hex
+    lease = timedelta(seconds=settings.ASSISTANT_RUN_DEADLINE_SECONDS + settings.THREAD_RUN_LOCK_MARGIN)
+    users = get_user_model().objects.filter(pk=user.pk)
+    give_up_at = time.monotonic() + (settings.THREAD_RUN_WAIT_SECONDS if wait else 0)
+    delay = settings.THREAD_RUN_POLL_INITIAL_DELAY
+
+    while not users.filter(Q(run_lock_token__isnull=True) | Q(run_locked_until__lt=now())).update(
+        run_lock_token=token,
+        run_locked_until=now() + lease,
+    ):
+        if time.monotonic() + delay > give_up_at:
+            raise ThreadBusyError("The previous message is still being answered, please try again in a moment.")
+        time.sleep(delay)
+        delay = min(delay * 2, settings.THREAD_RUN_POLL_MAX_DELAY)
+
+    try:
+        yield
+    finally:
+        users.filter(run_lock_token=token).update(run_lock_token=None, run_locked_until=None)
+
+
+def add_message_to_idle_thread(thread_id, message):
+    """
+    Adds the user's message to the thread; to be called under thread_run_lock. A run that is still active
+    then was left behind by a request that died, so it is cancelled and the message added once more.
+    """
+    try:
+        return add_message_to_thread(thread_id, message)
+    except BadRequestError as e:
+        if "active" not in str(e).lower():
+            raise
+
+    for run in cancel_active_run(thread_id):
+        _wait_for_run_to_stop(thread_id, run)
+    return add_message_to_thread(thread_id, message)
+
+
+def reap_stale_runs(older_than=None):
+    """
+    Cancels the runs that are active for longer than `older_than` seconds (THREAD_RUN_STALE_SECONDS by default)
+    on threads whose lock lease expired without a release. Every request releases its lock when it ends,
+    so these are the threads of workers that died during a run. Returns the number of cancelled runs.
+    """
+    started_before = time.time() - (older_than or settings.THREAD_RUN_STALE_SECONDS)
+    abandoned = get_user_model().objects.filter(
+        thread_id__isnull=False,
+        run_lock_token__isnull=False,
+        run_locked_until__lt=now(),
+    )
+
+    cancelled = 0
+    for user in abandoned.only("id", "thread_id").iterator():
+        try:
+            # Taking over the expired lease and releasing it again leaves the thread out of later passes
+            with thread_run_lock(user, wait=False):
+                cancelled += len(cancel_active_run(user.thread_id, started_before=started_before))
+        except ThreadBusyError:
+            # A new request took over the thread, it cancels the orphaned run itself
+            continue
+    return cancelled
+
+
+def _wait_for_run_to_stop(thread_id, run):
+    give_up_at = time.monotonic() + settings.THREAD_RUN_WAIT_SECONDS
+    delay = settings.THREAD_RUN_POLL_INITIAL_DELAY
+    while run.status == "cancelling" and time.monotonic() + delay < give_up_at:
+        time.sleep(delay)
+        delay = min(delay * 2, settings.THREAD_RUN_POLL_MAX_DELAY)
+        run = retrieve_current_run(thread_id, run.id)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+STALE_TMP_FILE_SECONDS = 60 * 60
+
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache of synthesized speech, shared by all workers on a host.
+
+    Every clip is stored as `<sha256 of the synthesis parameters>.mp3` and written atomically, so readers
+    never see a partial file. Recency is tracked through the file modification time, which a hit bumps,
+    so the least recently used clips are evicted first once the directory grows beyond `max_bytes`.
+    Each process keeps an in-memory LRU index of the directory and re-scans it before evicting, since
+    other workers add files too. Eviction goes down to `low_water_bytes`, so that a full cache is not
+    re-scanned on every write.
+    """
+
+    def __init__(self, directory, max_bytes, low_water_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water_bytes = low_water_bytes
+
+        self._lock = threading.Lock()
+        self._index = None  # OrderedDict of file name -> size, least recently used first
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def get(self, key):
+        file_name = f"{key}.mp3"
+        path = os.path.join(self.directory, file_name)
+        try:
+            with open(path, "rb") as cached_file:
+                audio = cached_file.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+                if self._index is not None and file_name in self._index:
+                    # Evicted by another worker
+                    self._total_bytes -= self._index.pop(file_name)
+            return None
+
+        with self._lock:
+            self._stats["hits"] += 1
+            if self._index is not None and file_name in self._index:
+                self._index.move_to_end(file_name)
+        return audio
+
+    def set(self, key, audio):
+        writer = self.open_writer(key)
+        if writer is not None:
+            writer.write(audio)
+            writer.commit()
+
+    def open_writer(self, key):
+        """
+        Returns a TTSCacheWriter that stores a clip chunk by chunk, or None if the cache directory is not writable.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_file = tempfile.NamedTemporaryFile("wb", dir=self.directory, delete=False, suffix=".tmp")
+        except OSError as e:
+            print(f"Could not write to the TTS cache: {e}")
+            return None
+        return TTSCacheWriter(self, f"{key}.mp3", tmp_file)
+
+    def _add(self, file_name, size):
+        with self._lock:
+            self._stats["writes"] += 1
+            self._load_index()
+            self._total_bytes += size - self._index.pop(file_name, 0)
+            self._index[file_name] = size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                "bytes": self._total_bytes if self._index is not None else None,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _load_index(self, force=False):
+        if self._index is not None and not force:
+            return
+
+        entries = []
+        try:
+            with os.scandir(self.directory) as directory:
+                for entry in directory:
+                    if entry.name.endswith(".tmp"):
+                        # Left behind by a worker that died while streaming a clip
+                        try:
+                            if entry.stat().st_mtime < time.time() - STALE_TMP_FILE_SECONDS:
+                                os.remove(entry.path)
+                        except OSError:
+                            pass
+                    elif entry.name.endswith(".mp3"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError:
+            pass
+
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._total_bytes = sum(self._index.values())
+
+    def _evict(self):
+        # Other workers have written and read files since the index was built
+        self._load_index(force=True)
+
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        while self._total_bytes > self.low_water_bytes and self._index:
+            file_name, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+                self._stats["evictions"] += 1
+            except OSError:
+                pass
+
+
+class TTSCacheWriter:
+    """
+    Writes a clip to a temporary file in the cache directory, which `commit` moves into place atomically.
+    A writer that is aborted or fails leaves nothing behind.
+    """
+
+    def __init__(self, cache, file_name, tmp_file):
+        self.cache = cache
+        self.file_name = file_name
+        self._tmp_file = tmp_file
+        self._size = 0
+
+    def write(self, data):
+        if self._tmp_file is None:
+            return
+        try:
+            self._tmp_file.write(data)
+            self._size += len(data)
+        except OSError as e:
+            print(f"Could not write to the TTS cache: {e}")
+            self.abort()
+
+    def commit(self):
+        if self._tmp_file is None:
+            return
+        if not self._size:
+            self.abort()
+            return
+        tmp_file, self._tmp_file = self._tmp_file, None
+        try:
+            tmp_file.close()
+            os.replace(tmp_file.name, os.path.join(self.cache.directory, self.file_name))
+        except OSError as e:
+            print(f"Could not write to the TTS cache: {e}")
+            _remove_quietly(tmp_file.name)
+            return
+        self.cache._add(self.file_name, self._size)
+
+    def abort(self):
+        if self._tmp_file is None:
+            return
+        tmp_file, self._tmp_file = self._tmp_file, None
+        tmp_file.close()
+        _remove_quietly(tmp_file.name)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def get_tts_cache_key(voice_id, model_id, voice_settings, text):
+    """
+    Hashes everything that determines the synthesized audio. Whitespace in the text is normalized.
+    """
+    key_data = {
+        "voice_id": voice_id,
+        "model_id": model_id,
+        "stability": voice_settings["stability"],
+        "similarity_boost": voice_settings["similarity_boost"],
+        "style": voice_settings["style"],
+        "use_speaker_boost": voice_settings["use_speaker_boost"],
+        "text": " ".join(text.split()),
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+
+tts_cache = TTSCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES, settings.TTS_CACHE_LOW_WATER_BYTES)
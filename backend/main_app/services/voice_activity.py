@@ -0,0 +1,68 @@
+import numpy as np
+from django.conf import settings
+
+
+def detect_speech(samples, sample_rate):
+    """
+    Energy based voice activity detection over mono float samples.
+
+    Returns [(start, end)] sample ranges that contain speech. A frame is speech if its energy is above
+    VAD_ENERGY_THRESHOLD_DB and within VAD_DYNAMIC_RANGE_DB of the loudest frame. Pauses shorter than
+    VAD_MIN_PAUSE_MS belong to the surrounding speech, bursts shorter than VAD_MIN_SPEECH_MS are dropped
+    and every range is padded by VAD_PADDING_MS.
+    """
+    frame_length = max(int(sample_rate * settings.VAD_FRAME_MS / 1000), 1)
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return []
+
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    energy_db = 10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10)
+    threshold_db = max(settings.VAD_ENERGY_THRESHOLD_DB, energy_db.max() - settings.VAD_DYNAMIC_RANGE_DB)
+    is_speech = energy_db > threshold_db
+
+    # Close short pauses between speech, leading and trailing silence stays
+    for start, end in _get_runs(~is_speech):
+        if start > 0 and end < frame_count and end - start < _to_frames(settings.VAD_MIN_PAUSE_MS):
+            is_speech[start:end] = True
+    for start, end in _get_runs(is_speech):
+        if end - start < _to_frames(settings.VAD_MIN_SPEECH_MS):
+            is_speech[start:end] = False
+
+    padding = int(sample_rate * settings.VAD_PADDING_MS / 1000)
+    return [
+        (max(start * frame_length - padding, 0), min(end * frame_length + padding, len(samples)))
+        for start, end in _get_runs(is_speech)
+    ]
+
+
+def split_at_pauses(samples, sample_rate):
+    """
+    Drops leading and trailing silence and splits the recording at pauses into segments of at most
+    VAD_MAX_SEGMENT_SECONDS. Speech that runs longer than that without a pause is cut hard.
+    Returns the segments in order, an empty list if there is no speech at all.
+    """
+    max_length = int(settings.VAD_MAX_SEGMENT_SECONDS * sample_rate)
+
+    ranges = []
+    for start, end in detect_speech(samples, sample_rate):
+        if ranges and end - ranges[-1][0] <= max_length:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+
+    return [
+        samples[chunk_start:min(chunk_start + max_length, end)]
+        for start, end in ranges
+        for chunk_start in range(start, end, max_length)
+    ]
+
+
+def _get_runs(mask):
+    # [start, end) of every run of True values
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges.reshape(-1, 2)
+
+
+def _to_frames(milliseconds):
+    return max(round(milliseconds / settings.VAD_FRAME_MS), 1)
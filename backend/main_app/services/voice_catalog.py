@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .eleven_labs import get_all_voices
+
+LABEL_FIELDS = ("accent", "gender", "age", "description", "use_case")
+
+
+class VoiceCatalog:
+    """
+    Process-wide cache of the ElevenLabs voice catalog.
+
+    The catalog is kept in memory for VOICE_CATALOG_TTL seconds. After that it is still served
+    for up to VOICE_CATALOG_STALE_TTL seconds while a background thread refreshes it. The raw
+    catalog is persisted to VOICE_CATALOG_CACHE_PATH so that a cold worker can answer without
+    calling ElevenLabs. Filtering uses an inverted index from lowercased label values to voices.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._fetched_at = None
+        self._voices = []
+        self._index = {}
+
+    def filter(self, **labels):
+        self._ensure_loaded()
+
+        with self._lock:
+            voices, index = self._voices, self._index
+
+        matches = None
+        for field, value in labels.items():
+            if not value:
+                continue
+            voice_positions = index.get(field, {}).get(value.lower(), set())
+            matches = voice_positions if matches is None else matches & voice_positions
+
+        if matches is None:
+            return list(voices)
+        return [voices[position] for position in sorted(matches)]
+
+    def _ensure_loaded(self):
+        age = self._get_age()
+
+        if age is None or age > settings.VOICE_CATALOG_STALE_TTL:
+            # Nothing usable cached, the caller has to wait for the catalog. Only one request loads it.
+            with self._load_lock:
+                if self._fetched_at is None:
+                    self._load_from_disk()
+                age = self._get_age()
+                if age is None or age > settings.VOICE_CATALOG_STALE_TTL:
+                    self._refresh()
+        elif age > settings.VOICE_CATALOG_TTL:
+            self._refresh_in_background()
+
+    def _get_age(self):
+        return time.time() - self._fetched_at if self._fetched_at else None
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            raw_voices = get_all_voices()
+            # An empty catalog means ElevenLabs could not be reached, keep serving what we have
+            if raw_voices:
+                fetched_at = time.time()
+                self._set_catalog(raw_voices, fetched_at)
+                self._save_to_disk(raw_voices, fetched_at)
+        except Exception as e:
+            print(f"Error while refreshing the voice catalog: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _set_catalog(self, raw_voices, fetched_at):
+        voices = []
+        index = {field: {} for field in LABEL_FIELDS}
+
+        for position, voice in enumerate(raw_voices):
+            labels = voice.get("labels", {})
+            voices.append({
+                "voice_id": voice["voice_id"],
+                "name": voice["name"],
+                "preview_url": voice.get("preview_url"),
+                **{field: labels.get(field) for field in LABEL_FIELDS},
+            })
+            for field in LABEL_FIELDS:
+                index[field].setdefault((labels.get(field) or "").lower(), set()).add(position)
+
+        with self._lock:
+            self._voices, self._index, self._fetched_at = voices, index, fetched_at
+
+    def _load_from_disk(self):
+        try:
+            with open(settings.VOICE_CATALOG_CACHE_PATH) as cache_file:
+                cached = json.load(cache_file)
+            self._set_catalog(cached["voices"], cached["fetched_at"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save_to_disk(self, raw_voices, fetched_at):
+        cache_dir = os.path.dirname(settings.VOICE_CATALOG_CACHE_PATH)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first so that other workers never read a partial catalog
+            with tempfile.NamedTemporaryFile("w", dir=cache_dir, delete=False, suffix=".tmp") as tmp_file:
+                json.dump({"fetched_at": fetched_at, "voices": raw_voices}, tmp_file)
+            os.replace(tmp_file.name, settings.VOICE_CATALOG_CACHE_PATH)
+        except OSError as e:
+            print(f"Could not persist the voice catalog: {e}")
+
+
+voice_catalog = VoiceCatalog()
+
+
+def filter_voices(accent=None, gender=None, age=None, description=None, use_case=None):
+    return voice_catalog.filter(accent=accent, gender=gender, age=age, description=description, use_case=use_case)
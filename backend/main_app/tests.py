@@ -1,3 +1,264 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.forms import modelform_factory
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from .admin import SubtaskAdmin
+from .models import Job, MainTask, Notification, Subtask
+from .services.intent_router import IntentRouter, TaskTitle, _get_title_key, match_task_title
+from .services.jobs import claim_jobs, enqueue_job, run_job, wait_for_job
+from .services.open_ai import add_decomposed_task, create_notifications
+from .services.task_counters import recompute_task_counters
+
+
+def create_user(email="user@example.com"):
+    return get_user_model().objects.create_user(email=email, password="password")
+
+
+def get_titles(*titles):
+    return [TaskTitle("main_task", index, index, title, None, _get_title_key(title)) for index, title in enumerate(titles)]
+
+
+@override_settings(INTENT_ROUTER_ENABLED=True, INTENT_ROUTER_MIN_SCORE=0.8, INTENT_ROUTER_MIN_MARGIN=0.1)
+class IntentRouterTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.router = IntentRouter(max_users=10)
+        # The exchange is noted on the OpenAI thread, which the tests do not have
+        patcher = mock.patch("main_app.services.intent_router.add_message_to_idle_thread")
+        self.add_note = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_completes_the_matching_task(self):
+        task = MainTask.objects.create(user=self.user, title="Buy milk")
+        Subtask.objects.create(main_task=task, title="Find a shop")
+
+        reply = self.router.route(self.user, "Please mark buy milk as done")
+
+        self.assertEqual(reply, 'Marked "Buy milk" as done.')
+        task.refresh_from_db()
+        self.assertTrue(task.is_completed)
+        self.assertFalse(Subtask.objects.filter(main_task=task, is_completed=False).exists())
+        self.add_note.assert_called_once()
+
+    def test_negated_messages_never_complete_a_task(self):
+        task = MainTask.objects.create(user=self.user, title="Buy milk")
+
+        for message in ("I didn't finish buy milk", "Mark buy milk as not done", "buy milk is not done yet"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.router.route(self.user, message))
+
+        task.refresh_from_db()
+        self.assertFalse(task.is_completed)
+        self.add_note.assert_not_called()
+
+    def test_ambiguous_titles_go_to_the_assistant(self):
+        MainTask.objects.create(user=self.user, title="Call mom")
+        MainTask.objects.create(user=self.user, title="Call tom")
+
+        self.assertIsNone(self.router.route(self.user, "Mark call om as done"))
+        self.assertFalse(MainTask.objects.filter(is_completed=True).exists())
+        self.assertEqual(self.router.get_stats()["unmatched"], 1)
+
+    def test_unknown_messages_go_to_the_assistant(self):
+        MainTask.objects.create(user=self.user, title="Buy milk")
+
+        self.assertIsNone(self.router.route(self.user, "How should I plan my week?"))
+        self.assertEqual(self.router.get_stats()["hits"], 0)
+
+
+@override_settings(INTENT_ROUTER_MIN_SCORE=0.8, INTENT_ROUTER_MIN_MARGIN=0.1)
+class MatchTaskTitleTests(TestCase):
+    def test_returns_the_clearly_best_title(self):
+        titles = get_titles("Buy milk", "Write the report")
+
+        self.assertEqual(match_task_title(titles, "by milk").title, "Buy milk")
+
+    def test_requires_the_minimum_score(self):
+        self.assertIsNone(match_task_title(get_titles("Buy milk"), "book flights"))
+
+    def test_requires_the_margin_to_the_next_best_title(self):
+        titles = get_titles("Call mom", "Call tom")
+
+        # 1.0 for "call mom" against 0.875 for "call tom"
+        self.assertEqual(match_task_title(titles, "call mom").title, "Call mom")
+        with override_settings(INTENT_ROUTER_MIN_MARGIN=0.2):
+            self.assertIsNone(match_task_title(titles, "call mom"))
+
+
+class NotificationPaginationTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        task = MainTask.objects.create(user=self.user, title="Buy milk")
+        other_task = MainTask.objects.create(user=create_user("other@example.com"), title="Other")
+        Notification.objects.bulk_create(
+            [Notification(user=self.user, main_task=task, is_read=index % 3 == 0) for index in range(7)]
+            + [Notification(user=other_task.user, main_task=other_task)]
+        )
+        # Equal creation times, the id decides the order within them
+        Notification.objects.update(created_at=now())
+
+    def test_pages_follow_the_list_order_without_gaps(self):
+        response = self.client.get(reverse("notifications"))
+        expected_ids = [notification["id"] for notification in response.json()]
+        self.assertEqual(len(expected_ids), 7)
+
+        page_ids = []
+        url = f"{reverse('notifications')}?page_size=3"
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page["results"]), 3)
+            page_ids += [notification["id"] for notification in page["results"]]
+            url = page["next"]
+
+        self.assertEqual(page_ids, expected_ids)
+        unread = list(Notification.objects.filter(user=self.user, is_read=False).order_by("-id").values_list("id", flat=True))
+        self.assertEqual(page_ids[:len(unread)], unread)
+
+    def test_rejects_an_invalid_cursor(self):
+        response = self.client.get(f"{reverse('notifications')}?cursor=invalid")
+
+        self.assertEqual(response.status_code, 404)
+
+
+def fail_job(message):
+    raise ValueError(message)
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=5)
+@mock.patch.dict("main_app.services.job_handlers.JOB_HANDLERS", {"echo": lambda value: value, "fail": fail_job})
+class JobTests(TestCase):
+    def test_pending_jobs_are_enqueued_once_per_key(self):
+        job = enqueue_job("echo", {"value": 1}, key="echo")
+
+        self.assertEqual(enqueue_job("echo", {"value": 2}, key="echo").pk, job.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_claims_only_due_jobs(self):
+        due_job = enqueue_job("echo", {"value": 1})
+        enqueue_job("echo", {"value": 2}, delay=60)
+
+        claimed = claim_jobs(limit=10)
+
+        self.assertEqual([job.pk for job in claimed], [due_job.pk])
+        self.assertEqual(claimed[0].status, Job.RUNNING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claim_jobs(limit=10), [])
+
+    def test_reclaims_jobs_whose_worker_died(self):
+        job = enqueue_job("echo", {"value": 1})
+        claim_jobs()
+        Job.objects.filter(pk=job.pk).update(locked_until=now() - timedelta(seconds=1))
+
+        claimed = claim_jobs()
+
+        self.assertEqual([claimed_job.attempts for claimed_job in claimed], [2])
+
+    def test_failed_jobs_are_retried_with_backoff_until_max_attempts(self):
+        job = enqueue_job("fail", {"message": "boom"})
+
+        run_job(claim_jobs()[0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIn("ValueError: boom", job.last_error)
+        self.assertGreater(job.run_at, now() + timedelta(seconds=4))
+
+        Job.objects.filter(pk=job.pk).update(run_at=now())
+        run_job(claim_jobs()[0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_wait_for_job_runs_the_job_and_returns_its_result(self):
+        self.assertEqual(wait_for_job(enqueue_job("echo", {"value": {"ok": True}})), {"ok": True})
+
+    def test_wait_for_job_fails_at_once_while_a_retry_is_pending(self):
+        job = enqueue_job("fail", {"message": "boom"})
+        with self.assertRaisesMessage(RuntimeError, "ValueError: boom"):
+            wait_for_job(job)
+
+        # The retry is left to the worker, a second waiter does not sit out the backoff
+        with self.assertRaisesMessage(RuntimeError, "ValueError: boom"):
+            wait_for_job(job, timeout=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+
+
+class TaskCounterTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_counters(self, task):
+        task.refresh_from_db()
+        return task.reminders_sent, task.subtask_total, task.subtask_done, task.is_completed
+
+    def complete_subtask(self, subtask_id, is_completed=True):
+        response = self.client.patch(
+            reverse("update-task"),
+            {"task_id": subtask_id, "task_type": "subtask", "is_completed": is_completed},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_subtask_progress_rolls_up_to_the_main_task(self):
+        output = add_decomposed_task(self.user, {"main_task": "Move", "subtasks": ["Pack", "Drive"]})
+        task = MainTask.objects.get(pk=output["main_task"]["id"])
+        first_id, second_id = (subtask["id"] for subtask in output["subtasks"])
+        self.assertEqual(self.get_counters(task), (0, 2, 0, False))
+
+        self.complete_subtask(first_id)
+        self.assertEqual(self.get_counters(task), (0, 2, 1, False))
+
+        self.complete_subtask(first_id, is_completed=False)
+        self.assertEqual(self.get_counters(task), (0, 2, 0, False))
+
+        self.complete_subtask(first_id)
+        self.complete_subtask(second_id)
+        self.assertEqual(self.get_counters(task), (0, 2, 2, True))
+
+    def test_reminders_are_counted_per_task(self):
+        task = MainTask.objects.create(user=self.user, title="Buy milk")
+        other_task = MainTask.objects.create(user=create_user("other@example.com"), title="Other")
+
+        create_notifications(self.user, {"task_ids": [task.id, task.id, other_task.id]})
+        output = create_notifications(self.user, {"task_ids": [task.id]})
+
+        self.assertEqual(output["created_notifications"], [{"task_id": task.id, "reminder_count": 2}])
+        self.assertEqual(self.get_counters(task), (2, 0, 0, False))
+        self.assertIsNotNone(task.last_reminded_at)
+        self.assertEqual(self.get_counters(other_task), (0, 0, 0, False))
+
+    def test_recompute_restores_drifted_counters(self):
+        task = MainTask.objects.create(user=self.user, title="Buy milk", reminders_sent=5, subtask_total=9)
+        Subtask.objects.create(main_task=task, title="Find a shop", is_completed=True)
+        Notification.objects.create(user=self.user, main_task=task)
+
+        recompute_task_counters(MainTask.objects.filter(pk=task.pk))
+
+        self.assertEqual(self.get_counters(task), (1, 1, 1, False))
+
+    def test_moving_a_subtask_in_the_admin_updates_both_tasks(self):
+        task = MainTask.objects.create(user=self.user, title="Buy milk")
+        other_task = MainTask.objects.create(user=self.user, title="Cook dinner")
+        subtask = Subtask.objects.create(main_task=task, title="Find a shop")
+        recompute_task_counters(MainTask.objects.filter(user=self.user))
+
+        form = modelform_factory(Subtask, fields=["title", "main_task", "is_completed"])(
+            data={"title": subtask.title, "main_task": other_task.pk}, instance=subtask,
+        )
+        self.assertTrue(form.is_valid())
+        SubtaskAdmin(Subtask, site).save_model(None, form.save(commit=False), form, change=True)
+
+        self.assertEqual(self.get_counters(task), (0, 0, 0, False))
+        self.assertEqual(self.get_counters(other_task), (0, 1, 0, False))
@@ -1,17 +1,21 @@
 # from rest_framework.routers import SimpleRouter
 from django.urls import path, include
 
-from .views import AssistantAPIView, AudioToChatAPIView, UpdateTaskAPIView, UserTasksAPIView, NotificationsAPIView, VoiceSelectionAPIView, VoiceSettingsAPIView, VoiceConfigAPIView
+from .views import AssistantAPIView, AssistantStreamAPIView, AudioToChatAPIView, TextToSpeechStreamAPIView, UpdateTaskAPIView, UserTasksAPIView, NotificationsAPIView, UnreadNotificationsCountAPIView, VoiceSelectionAPIView, VoiceSettingsAPIView, VoiceConfigAPIView, MetricsAPIView
 
 # router = SimpleRouter()
 
 urlpatterns = [
     path('assistant-request/', AssistantAPIView.as_view(), name='assistant_request'),
+    path('assistant-request/stream/', AssistantStreamAPIView.as_view(), name='assistant_request_stream'),
     path('assistant-voice-request/', AudioToChatAPIView.as_view(), name='assistant_voice_request'),
+    path('text-to-speech/stream/', TextToSpeechStreamAPIView.as_view(), name='text_to_speech_stream'),
     path('todo/', UserTasksAPIView.as_view(), name='user-tasks'),
     path("tasks/update/", UpdateTaskAPIView.as_view(), name="update-task"),
     path("notifications/", NotificationsAPIView.as_view(), name="notifications"),
+    path("notifications/unread-count/", UnreadNotificationsCountAPIView.as_view(), name="notifications-unread-count"),
     path("voice-selection/", VoiceSelectionAPIView.as_view(), name="voice-selection"),
     path("voice-settings/", VoiceSettingsAPIView.as_view(), name="voice-settings"),
     path("voice-config/", VoiceConfigAPIView.as_view(), name="voice-config"),
+    path("metrics/", MetricsAPIView.as_view(), name="metrics"),
 ]
\ No newline at end of file
@@ -1,34 +1,61 @@
 import base64
+import hashlib
+import json
+import uuid
 from datetime import timedelta
-import time
+from urllib.parse import quote
 import os
 import tempfile
 # from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import UploadedFile
+from django.db.models import Count, F, Max
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
 from django.utils.timezone import now
 # from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
 
 from .models import MainTask, Subtask, Notification, VoiceConfig
 
+from .pagination import NotificationKeysetPagination, TaskCursorPagination
+from .renderers import EventStreamRenderer, MPEGAudioRenderer, MultipartMixedRenderer, format_sse_event, iter_multipart_mixed
+from .responses import IncrementalStreamingHttpResponse
 from .serializers import AssistantRequestSerializer, MainTaskSerializer, NotificationSerializer, VoiceConfigSerializer
 from .services.open_ai import (
-    add_message_to_thread, 
-    cancel_active_run, 
-    create_assistant, 
-    create_thread, 
-    handle_function_calling,
-    modify_assistant_instruction, 
-    retrieve_assistant_response, 
-    retrieve_current_run, 
-    run_assistant,
-    convert_audio_to_text
+    schedule_assistant_instruction_update, 
+    schedule_assistant_provisioning, 
+    convert_audio_to_text,
+    get_tool_stats,
+)
+from .services.jobs import wait_for_job
+from .services.thread_pool import get_thread_id, release_thread
+from .services.thread_runs import ThreadBusyError, add_message_to_idle_thread, thread_run_lock
+from .services.task_counters import record_subtasks
+from .services.assistant_run import run_assistant_to_completion
+from .services.intent_router import intent_router, iter_answer_events
+from .services.speech_pipeline import SentenceSpeechPipeline
+from .services.assistant_instructions import INSTRUCTION_FIELDS
+from .services.voice_catalog import filter_voices
+from .services.tts_cache import tts_cache
+from .services.eleven_labs import (
+    eleven_labs_client,
+    get_text_to_speech_cache_key,
+    get_voice_settings,
+    iter_text_to_speech,
+    open_text_to_speech_stream,
+    update_voice_settings,
+    VOICE_SETTINGS_FIELDS,
 )
-from .services.eleven_labs import convert_text_to_speech, filter_voices, get_voice_settings, update_voice_settings
 
 
 class AssistantAPIView(APIView):
@@ -42,108 +69,315 @@ class AssistantAPIView(APIView):
 
         user = request.user
 
-        # Check if user has assistant_id and thread_id
-        if not user.assistant_id:
-            assistant = create_assistant(user)
-            thread = create_thread()
-
-            user.assistant_id = assistant.id
-            user.thread_id = thread.id
-            user.save()
-        elif not user.thread_id and user.assistant_id:
-            thread = create_thread()
-            user.thread_id = thread.id
-            user.save()
+        error_response = get_assistant_thread_error_response(user)
+        if error_response is not None:
+            return error_response
 
         # Process the assistant interaction
-        response_message = process_request_message_to_assistant(user, message)
+        try:
+            response_message = process_request_message_to_assistant(user, message)
+        except ThreadBusyError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
 
         return Response({"response": response_message}, status=status.HTTP_200_OK)
 
+
+class AssistantStreamAPIView(APIView):
+    """
+    Same as AssistantAPIView, but streams the reply as Server-Sent Events:
+    `delta` for generated text, `tool` while a function is executed,
+    `done` with the full response and `error` if the run fails.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        serializer = AssistantRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        message = serializer.validated_data["message"]
+
+        user = request.user
+        error_response = get_assistant_thread_error_response(user)
+        if error_response is not None:
+            return error_response
+
+        response = IncrementalStreamingHttpResponse(
+            stream_assistant_response(user, message),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Do not let a reverse proxy buffer the events
+        return response
+
         
     
 class AudioToChatAPIView(APIView):
+    """
+    Answers a voice message. The response format is negotiated through the Accept header:
+
+    - application/json (default): `response`, `input_text` and the base64 encoded `audio_response`
+    - audio/mpeg: the raw audio, with the percent-encoded texts in X-Input-Text and X-Response-Text
+    - multipart/mixed: an audio/mpeg part streamed while the speech is synthesized, followed by an
+      application/json part with `response` and `input_text` (or `error` if the run failed midway)
+    """
     permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, MPEGAudioRenderer, MultipartMixedRenderer]
 
     def post(self, request):
+        # Reject oversized uploads before Django reads the body
+        if int(request.META.get("CONTENT_LENGTH") or 0) > settings.AUDIO_UPLOAD_MAX_BYTES:
+            return Response({"error": "Audio file is too large."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
         audio_file: UploadedFile = request.FILES.get('file')
         if not audio_file:
             return Response({"error": "No audio file provided."}, status=status.HTTP_400_BAD_REQUEST)
+        if audio_file.size > settings.AUDIO_UPLOAD_MAX_BYTES:
+            return Response({"error": "Audio file is too large."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
 
         try:
             text_message = convert_audio_to_text(audio_file)
         except Exception as e:
             return Response({"error": f"Failed to process audio: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        user = request.user
+        error_response = get_assistant_thread_error_response(user)
+        if error_response is not None:
+            return error_response
+
         try:
-            user = request.user
-
-            # Check if user has assistant_id and thread_id
-            if not user.assistant_id:
-                assistant = create_assistant(user)
-                thread = create_thread()
-
-                user.assistant_id = assistant.id
-                user.thread_id = thread.id
-                user.save()
-            elif not user.thread_id and user.assistant_id:
-                thread = create_thread()
-                user.thread_id = thread.id
-                user.save()
-
-            response_message = process_request_message_to_assistant(user, text_message)
+            if request.accepted_renderer.format == "multipart":
+                boundary = uuid.uuid4().hex
+                return IncrementalStreamingHttpResponse(
+                    stream_voice_response(user, text_message, boundary),
+                    content_type=f"multipart/mixed; boundary={boundary}",
+                )
+
+            # Speech is synthesized sentence by sentence while the assistant is still answering
+            response_message, audio_response = process_voice_message_to_assistant(user, text_message)
+        except ThreadBusyError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({"error": f"Failed to process assistant message: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        try:
-            audio_response = convert_text_to_speech(user, response_message)
-            if not audio_response:
-                raise ValueError("Failed to generate audio response")
-            
-            audio_base64 = base64.b64encode(audio_response).decode('utf-8')
-        except Exception as e:
-            return Response({"error": f"Failed to generate audio response: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if request.accepted_renderer.format == "mp3":
+            return Response(audio_response, status=status.HTTP_200_OK, headers={
+                "X-Input-Text": quote(text_message),
+                "X-Response-Text": quote(response_message),
+            })
+
+        audio_base64 = base64.b64encode(audio_response).decode('utf-8')
 
         return Response({"response": response_message, "input_text": text_message, "audio_response": audio_base64}, status=status.HTTP_200_OK)
     
 
 
+class TextToSpeechStreamAPIView(APIView):
+    """
+    Streams the speech for a message as audio/mpeg, forwarding ElevenLabs chunks as they arrive.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, MPEGAudioRenderer]
+
+    def post(self, request):
+        serializer = AssistantRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        message = serializer.validated_data["message"]
+
+        try:
+            cache_key = get_text_to_speech_cache_key(request.user, message)
+        except VoiceConfig.DoesNotExist:
+            return Response({"error": "Voice is not configured"}, status=status.HTTP_400_BAD_REQUEST)
+
+        cached_audio = tts_cache.get(cache_key) if settings.TTS_CACHE_ENABLED else None
+        if cached_audio is not None:
+            return HttpResponse(cached_audio, content_type="audio/mpeg")
+
+        try:
+            tts_response = open_text_to_speech_stream(request.user, message)
+        except Exception as e:
+            return Response({"error": f"Error while fetching response from ElevenLabs: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+
+        if tts_response.status_code != 200:
+            tts_response.close()
+            return Response({"error": "Failed to generate audio response"}, status=status.HTTP_502_BAD_GATEWAY)
+
+        response = IncrementalStreamingHttpResponse(iter_text_to_speech(tts_response, cache_key), content_type="audio/mpeg")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
 def process_request_message_to_assistant(user, message):
         """
         Sends a message to the assistant and processes its response.
         """
-        try:
+        with thread_run_lock(user):
+            # Simple commands are answered without an assistant run
+            response_message = intent_router.route(user, message)
+            if response_message is not None:
+                return response_message
+
             # Add the user's message to the thread
-            add_message_to_thread(user.thread_id, message)
-            # Run the assistant
-            run = run_assistant(user.thread_id, user.assistant_id)
-
-            # Handle the run and retrieve a response
-            while run.status != "completed":
-                if run.status == "requires_action":
-                    handle_function_calling(run, user)
-                time.sleep(0.5)
-                run = retrieve_current_run(user.thread_id, run.id)  # To get the latest run update to check whether it's status has changed
-
-            # Retrieve the assistant's response
-            messages = retrieve_assistant_response(user.thread_id)
-            return messages.data[0].content[0].text.value
+            add_message_to_idle_thread(user.thread_id, message)
+            # Run the assistant until its final response arrives
+            return run_assistant_to_completion(user)
+
+def process_voice_message_to_assistant(user, message):
+    """
+    Sends a message to the assistant and returns its response together with the synthesized speech.
+    """
+    with thread_run_lock(user):
+        pipeline = SentenceSpeechPipeline(user)
+        audio_response = b"".join(pipeline.run(iter_answer_events(user, message)))
+        return pipeline.response_text, audio_response
+
+
+def stream_voice_response(user, message, boundary):
+    """
+    Yields the multipart/mixed voice response: the audio as it is synthesized, then the texts as JSON.
+    The status has been sent by then, so a failure is reported in the JSON part.
+    """
+    pipeline = SentenceSpeechPipeline(user)
+    result = {"input_text": message}
+
+    def iter_audio():
+        try:
+            with thread_run_lock(user):
+                yield from pipeline.run(iter_answer_events(user, message))
         except Exception as e:
-            # Handle active run error
-            error_message = str(e)
-            if "active" in error_message.lower():
-                cancel_active_run(user.thread_id)
-            raise e
+            result["error"] = f"Failed to process assistant message: {str(e)}"
+
+    def iter_result():
+        yield json.dumps({"response": pipeline.response_text, **result}).encode("utf-8")
+
+    yield from iter_multipart_mixed([("audio/mpeg", iter_audio()), ("application/json", iter_result())], boundary)
+
+
+TOOL_PROGRESS_MESSAGES = {
+    "add_task": "Adding task…",
+    "add_decomposed_task": "Adding task with subtasks…",
+    "get_tasks": "Looking at your tasks…",
+    "check_due_date_tasks": "Checking upcoming deadlines…",
+    "get_current_date_time": "Checking the date…",
+    "create_notifications": "Creating reminders…",
+    "update_user_ttm_stage": "Updating your progress…",
+}
+
+
+def stream_assistant_response(user, message):
+    """
+    Sends a message to the assistant and yields its response as Server-Sent Events.
+    """
+    try:
+        with thread_run_lock(user):
+            for event_type, payload in iter_answer_events(user, message):
+                if event_type == "text_delta":
+                    yield format_sse_event("delta", {"text": payload})
+                elif event_type == "tool_call":
+                    yield format_sse_event("tool", {
+                        "name": payload,
+                        "message": TOOL_PROGRESS_MESSAGES.get(payload, "Working on it…"),
+                    })
+                elif event_type == "completed":
+                    yield format_sse_event("done", {"response": payload})
+    except ThreadBusyError as e:
+        yield format_sse_event("error", {"error": str(e)})
+    except Exception as e:
+        yield format_sse_event("error", {"error": f"Failed to process assistant message: {str(e)}"})
+
+
+def ensure_assistant_thread(user):
+    """
+    Makes sure the user has an assistant and a thread. They are normally provisioned in the background
+    after the voice configuration; if that has not happened yet, the request waits for the job.
+    """
+    if user.assistant_id and user.thread_id:
+        return
+
+    if not user.assistant_id and not VoiceConfig.objects.filter(user=user).exists():
+        # The assistant is created from the voice configuration, provisioning could only fail
+        raise VoiceConfig.DoesNotExist("Voice is not configured")
+
+    if user.assistant_id:
+        # Only the thread is missing, a pre-created one is handed out right away
+        thread_id = get_thread_id()
+        if not get_user_model().objects.filter(pk=user.pk, thread_id__isnull=True).update(thread_id=thread_id):
+            # A concurrent request has assigned a thread first
+            release_thread(thread_id)
+        user.refresh_from_db(fields=["thread_id"])
+        return
+
+    wait_for_job(schedule_assistant_provisioning(user))
+    user.refresh_from_db(fields=["assistant_id", "thread_id", "assistant_instructions_hash"])
+
+def get_assistant_thread_error_response(user):
+    """
+    Runs `ensure_assistant_thread` and returns the error response if the user's assistant is not available.
+    """
+    try:
+        ensure_assistant_thread(user)
+    except VoiceConfig.DoesNotExist:
+        return Response({"error": "Voice is not configured"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        # The provisioning job failed or is still waiting for a worker, or no thread could be created
+        return Response({"error": f"The assistant is not available yet: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return None
 
 class UserTasksAPIView(ListAPIView):
     """
     API view to fetch tasks for the authenticated user.
+
+    Supports `is_completed`, `due_after` and `due_before` filters, cursor pagination
+    and conditional GET through `ETag`. There is no `Last-Modified`: deleting a task other than the
+    most recently updated one does not change the latest update time.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = MainTaskSerializer
+    pagination_class = TaskCursorPagination
 
     def get_queryset(self):
-        return MainTask.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = MainTask.objects.filter(user=self.request.user).prefetch_related('subtasks').order_by('-created_at')
+
+        is_completed = self.request.query_params.get("is_completed")
+        if is_completed is not None:
+            queryset = queryset.filter(is_completed=is_completed.lower() in ("true", "1"))
+
+        for param, lookup in (("due_after", "due_date__gte"), ("due_before", "due_date__lte")):
+            value = self.request.query_params.get(param)
+            if value:
+                due_date = parse_datetime(value)
+                if due_date is None:
+                    raise ValidationError({param: "Invalid datetime"})
+                queryset = queryset.filter(**{lookup: due_date})
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(self.get_queryset())
+
+        not_modified_response = get_conditional_response(request, etag=etag)
+        if not_modified_response is not None:
+            not_modified_response["ETag"] = etag
+            return not_modified_response
+
+        response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def get_list_etag(self, queryset):
+        """
+        Derives the ETag of the list from a single aggregate query, the counts cover deletions.
+        """
+        version = queryset.order_by().aggregate(
+            task_count=Count("id", distinct=True),
+            subtask_count=Count("subtasks"),
+            task_updated_at=Max("updated_at"),
+            subtask_updated_at=Max("subtasks__updated_at"),
+        )
+        etag_source = f"{self.request.user.pk}:{self.request.GET.urlencode()}:{sorted(version.items())}"
+        etag = quote_etag(hashlib.md5(etag_source.encode(), usedforsecurity=False).hexdigest())
+        return etag
 
 
 class UpdateTaskAPIView(APIView):
@@ -164,33 +398,44 @@ class UpdateTaskAPIView(APIView):
             # Update MainTask
             if task_type == "main_task":
                 task = MainTask.objects.get(id=task_id, user=request.user)
+                # Only the edited fields are saved so that the maintained counters are never overwritten
+                update_fields = ["updated_at"]
                 if title is not None:
                     task.title = title
+                    update_fields.append("title")
                 if description is not None:
                     task.description = description
+                    update_fields.append("description")
                 if due_date is not None:
                     task.due_date = due_date
+                    update_fields.append("due_date")
                 if is_completed is not None:
                     task.is_completed = is_completed
+                    update_fields.append("is_completed")
                     if is_completed:
                         # Mark all subtasks as completed
-                        task.subtasks.update(is_completed=True)
-                task.save()
+                        task.subtasks.update(is_completed=True, updated_at=now())
+                        task.subtask_done = F("subtask_total")
+                        update_fields.append("subtask_done")
+                task.save(update_fields=update_fields)
 
             # Update SubTask
             elif task_type == "subtask":
                 subtask = Subtask.objects.get(id=task_id, main_task__user=request.user)
+                was_completed = subtask.is_completed
                 if title is not None:
                     subtask.title = title
                 if is_completed is not None:
                     subtask.is_completed = is_completed
                 subtask.save()
 
-                # If all subtasks are completed, mark MainTask as completed
-                # main_task = subtask.main_task
-                # if not main_task.subtasks.filter(is_completed=False).exists():
-                #     main_task.is_completed = True
-                #     main_task.save()
+                if subtask.is_completed != was_completed:
+                    record_subtasks(subtask.main_task_id, completed=1 if subtask.is_completed else -1)
+
+                    # If all subtasks are completed, mark MainTask as completed
+                    MainTask.objects.filter(
+                        id=subtask.main_task_id, is_completed=False, subtask_done=F("subtask_total")
+                    ).update(is_completed=True, updated_at=now())
 
             else:
                 return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -211,27 +456,58 @@ class NotificationsAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        notifications = Notification.objects.filter(user=request.user).order_by('is_read')
+        notifications = Notification.objects.filter(user=request.user).select_related('main_task').order_by('is_read', '-created_at', '-id')
+
+        paginator = NotificationKeysetPagination()
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        if page is not None:
+            serializer = NotificationSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
         serializer = NotificationSerializer(notifications, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def patch(self, request, *args, **kwargs):
+        """
+        Marks a single notification (`notification_id`), a list of them (`notification_ids`)
+        or all of them (`all`) as read with a single UPDATE.
+        """
         notification_id = request.data.get("notification_id")
+        notification_ids = request.data.get("notification_ids")
+        mark_all = request.data.get("all") is True
 
-        if not notification_id:
+        if not notification_id and not notification_ids and not mark_all:
             return Response({"error": "Notification ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            notification = Notification.objects.get(id=notification_id, user=request.user)
-            notification.is_read = True
-            notification.save()
-            return Response({"message": "Notification marked as read"}, status=status.HTTP_200_OK)
-        except Notification.DoesNotExist:
-            return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+            notifications = Notification.objects.filter(user=request.user)
+
+            if notification_id:
+                if not notifications.filter(id=notification_id).update(is_read=True):
+                    return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+                return Response({"message": "Notification marked as read"}, status=status.HTTP_200_OK)
+
+            if not mark_all:
+                notifications = notifications.filter(id__in=notification_ids)
+            updated_count = notifications.filter(is_read=False).update(is_read=True)
+            return Response({"message": "Notifications marked as read", "updated": updated_count}, status=status.HTTP_200_OK)
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid notification IDs"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class UnreadNotificationsCountAPIView(APIView):
+    """
+    API view to get the number of unread notifications without fetching them.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+        return Response({"unread_count": unread_count}, status=status.HTTP_200_OK)
+
+
 class VoiceSelectionAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -271,32 +547,46 @@ class VoiceConfigAPIView(APIView):
         serializer = VoiceConfigSerializer(data=request.data)
 
         if serializer.is_valid():
-            voice_config, created = VoiceConfig.objects.update_or_create(
-                user=user,
-                defaults=serializer.validated_data
-            )
-
-            settings_response = update_voice_settings(
-                voice_id=voice_config.voice_id,
-                stability=voice_config.stability,
-                similarity_boost=voice_config.similarity_boost,
-                style=voice_config.style,
-                use_speaker_boost=voice_config.use_speaker_boost
-            )
-
-            if settings_response.get("status") != "ok":
-                return Response({"error": "Failed to update voice settings in ElevenLabs"}, status=status.HTTP_400_BAD_REQUEST)
+            voice_config = VoiceConfig.objects.filter(user=user).first()
+            is_new = voice_config is None
 
-            if not user.assistant_id or not user.thread_id:
-                assistant = create_assistant(user)
-                thread = create_thread()
+            if is_new:
+                voice_config = VoiceConfig(user=user, **serializer.validated_data)
+                changed_fields = set(serializer.validated_data)
+            else:
+                # Only what actually changed is saved and pushed to ElevenLabs/OpenAI
+                changed_fields = {
+                    field for field, value in serializer.validated_data.items()
+                    if getattr(voice_config, field) != value
+                }
+                for field in changed_fields:
+                    setattr(voice_config, field, serializer.validated_data[field])
+
+            # Pushed before saving: if ElevenLabs fails nothing is stored, so the next save pushes again
+            if changed_fields & set(VOICE_SETTINGS_FIELDS):
+                settings_response = update_voice_settings(
+                    voice_id=voice_config.voice_id,
+                    stability=voice_config.stability,
+                    similarity_boost=voice_config.similarity_boost,
+                    style=voice_config.style,
+                    use_speaker_boost=voice_config.use_speaker_boost
+                )
+
+                if settings_response.get("status") != "ok":
+                    return Response({"error": "Failed to update voice settings in ElevenLabs"}, status=status.HTTP_400_BAD_REQUEST)
+
+            if is_new:
+                voice_config.save()
+            elif changed_fields:
+                voice_config.save(update_fields=changed_fields)
+            user.voice_config = voice_config
 
+            if not user.assistant_id or not user.thread_id:
                 user.vui_configured = True
-                user.assistant_id = assistant.id
-                user.thread_id = thread.id
-                user.save()
-            else:
-                modify_assistant_instruction(user)
+                user.save(update_fields=["vui_configured"])
+                schedule_assistant_provisioning(user)
+            elif changed_fields & set(INSTRUCTION_FIELDS):
+                schedule_assistant_instruction_update(user)
 
             return Response({
                 "message": "Voice configuration saved and updated in ElevenLabs! Assistant has created.",
@@ -312,4 +602,20 @@ class VoiceConfigAPIView(APIView):
             serializer = VoiceConfigSerializer(voice_config)
             return Response({"voice_config": serializer.data}, status=status.HTTP_200_OK)
         except VoiceConfig.DoesNotExist:
-            return Response({"voice_config": None}, status=status.HTTP_200_OK)
\ No newline at end of file
+            return Response({"voice_config": None}, status=status.HTTP_200_OK)
+
+
+class MetricsAPIView(APIView):
+    """
+    Counters of this worker process: TTS cache hits, misses and evictions, ElevenLabs latencies,
+    assistant tool call durations and how many messages the intent router answered without an assistant run.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "tts_cache": tts_cache.get_stats(),
+            "eleven_labs": eleven_labs_client.get_stats(),
+            "tools": get_tool_stats(),
+            "intent_router": intent_router.get_stats(),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,283 @@
+"""
+WebSocket voice session, served next to Django by performate_core/asgi.py at VOICE_SESSION_PATH.
+
+The client authenticates with its access token in the query string (`?token=...`) and keeps the
+socket open for the whole conversation. A turn looks like this:
+
+    client: {"type": "start", "format": "pcm16", "sample_rate": 48000}   (or "format": "wav"/"webm"/...)
+    client: <binary microphone chunks while recording>
+    client: {"type": "end"}
+    server: {"type": "transcript", "text": ...}
+    server: {"type": "delta", "text": ...} / {"type": "tool", ...} and <binary audio/mpeg per sentence>
+    server: {"type": "done", "response": ...}
+
+A text turn is a single {"type": "text", "message": ...}. Failures are sent as {"type": "error", "error": ...}.
+
+For `pcm16` (mono little-endian 16-bit samples) every chunk is resampled as soon as it arrives,
+so only silence trimming, encoding and the transcription itself are left when the user stops talking.
+Other formats are spooled and go through `convert_audio_to_text` at the end of the turn.
+"""
+import asyncio
+import json
+import tempfile
+import threading
+from urllib.parse import parse_qs
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .services.audio_preprocessing import StreamingResampler, encode_speech_segments
+from .services.intent_router import iter_answer_events
+from .services.open_ai import convert_audio_to_text, transcribe_segments
+from .services.speech_pipeline import SentenceSpeechPipeline
+from .services.thread_runs import ThreadBusyError, thread_run_lock
+from .views import TOOL_PROGRESS_MESSAGES, ensure_assistant_thread
+
+
+class AudioTurn:
+    """
+    Microphone audio of one turn, collected chunk by chunk.
+    """
+
+    def __init__(self, audio_format, sample_rate=None):
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.size = 0
+        self._samples = []
+        self._odd_byte = b""
+        self._resampler = StreamingResampler(sample_rate, settings.AUDIO_PREPROCESS_SAMPLE_RATE) if audio_format == "pcm16" else None
+        self._spool = None if audio_format == "pcm16" else tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        )
+
+    def add_chunk(self, chunk):
+        self.size += len(chunk)
+        if self._spool is not None:
+            self._spool.write(chunk)
+            return
+
+        # A chunk may end in the middle of a sample, its first byte then starts the next chunk
+        data = self._odd_byte + chunk
+        usable = len(data) - len(data) % 2
+        self._odd_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 2 ** 15
+        self._samples.append(self._resampler.process(samples))
+
+    def transcribe(self):
+        if self._spool is not None:
+            self._spool.seek(0)
+            audio_file = UploadedFile(
+                file=self._spool,
+                name=f"audio.{self.audio_format}",
+                content_type=f"audio/{self.audio_format}",
+                size=self.size,
+            )
+            return convert_audio_to_text(audio_file)
+
+        samples = np.concatenate(self._samples) if self._samples else np.zeros(0, dtype=np.float32)
+        segments = encode_speech_segments(samples, "audio")
+        return transcribe_segments(segments) if segments else ""
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+
+
+class SessionClosedError(Exception):
+    """
+    Raised in the answer worker thread once the client has disconnected.
+    """
+
+
+class VoiceSession:
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.user = None
+        self.turn = None
+        self.answer_task = None
+        # Set on disconnect, the answer worker thread checks it between run events and audio segments
+        self.closed = threading.Event()
+
+    async def run(self):
+        message = await self.receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        self.user = await self._authenticate()
+        if self.user is None:
+            # Closing before accepting rejects the handshake with 403
+            await self.send({"type": "websocket.close", "code": 4401})
+            return
+        await self.send({"type": "websocket.accept"})
+
+        try:
+            while True:
+                message = await self.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self._add_audio(message["bytes"])
+                elif message.get("text") is not None:
+                    await self._handle_command(message["text"])
+        finally:
+            self.closed.set()
+            if self.answer_task:
+                self.answer_task.cancel()
+            if self.turn:
+                self.turn.close()
+
+    async def _authenticate(self):
+        token = parse_qs(self.scope.get("query_string", b"").decode()).get("token", [None])[0]
+        if not token:
+            return None
+
+        authentication = JWTAuthentication()
+        try:
+            validated_token = authentication.get_validated_token(token)
+            # Not on the shared thread sensitive worker, where a slow query would hold up every session
+            return await sync_to_async(_get_user, thread_sensitive=False)(authentication, validated_token)
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            # AuthenticationFailed: the user was deleted or deactivated
+            return None
+
+    async def _handle_command(self, text):
+        try:
+            command = json.loads(text)
+        except ValueError:
+            await self._send_json({"type": "error", "error": "Messages must be JSON"})
+            return
+
+        if command.get("type") == "start":
+            if command.get("format", "pcm16") == "pcm16" and not command.get("sample_rate"):
+                await self._send_json({"type": "error", "error": "pcm16 audio needs a sample_rate"})
+                return
+            if self.turn:
+                self.turn.close()
+            self.turn = AudioTurn(command.get("format", "pcm16"), command.get("sample_rate"))
+
+        elif command.get("type") == "end":
+            if self.turn is None:
+                await self._send_json({"type": "error", "error": "No audio was started"})
+                return
+            turn, self.turn = self.turn, None
+            await self._start_answer(turn=turn)
+
+        elif command.get("type") == "text" and command.get("message"):
+            await self._start_answer(message=command["message"])
+
+        else:
+            await self._send_json({"type": "error", "error": "Unknown message"})
+
+    async def _add_audio(self, chunk):
+        if self.turn is None:
+            await self._send_json({"type": "error", "error": "No audio was started"})
+            return
+        if self.turn.size + len(chunk) > settings.AUDIO_UPLOAD_MAX_BYTES:
+            self.turn.close()
+            self.turn = None
+            await self._send_json({"type": "error", "error": "Audio file is too large."})
+            return
+
+        await sync_to_async(self.turn.add_chunk, thread_sensitive=False)(chunk)
+
+    async def _start_answer(self, turn=None, message=None):
+        if self.answer_task and not self.answer_task.done():
+            await self._send_json({"type": "error", "error": "The previous message is still being answered"})
+            if turn:
+                turn.close()
+            return
+        self.answer_task = asyncio.create_task(self._answer(turn, message))
+
+    async def _answer(self, turn, message):
+        try:
+            if turn is not None:
+                message = await sync_to_async(turn.transcribe, thread_sensitive=False)()
+                await self._send_json({"type": "transcript", "text": message})
+                if not message.strip():
+                    await self._send_json({"type": "error", "error": "No speech was detected"})
+                    return
+
+            loop = asyncio.get_running_loop()
+            events = asyncio.Queue()
+
+            def emit(event):
+                if not self.closed.is_set():
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+
+            run = asyncio.ensure_future(sync_to_async(self._run_assistant, thread_sensitive=False)(message, emit))
+
+            while (event := await events.get()) is not None:
+                if isinstance(event, bytes):
+                    await self.send({"type": "websocket.send", "bytes": event})
+                else:
+                    await self._send_json(event)
+            await run
+        except Exception as e:
+            await self._send_json({"type": "error", "error": f"Failed to process assistant message: {str(e)}"})
+        finally:
+            if turn is not None:
+                turn.close()
+
+    def _run_assistant(self, message, emit):
+        """
+        Runs in a worker thread and hands text, tool and audio events to the event loop through `emit`.
+        A disconnect stops it at the next run event or audio segment; closing the run events cancels the run.
+        """
+        try:
+            # May wait for the provisioning job, which must not hold up the other sessions
+            ensure_assistant_thread(self.user)
+
+            # Other sessions and HTTP requests of the user share the thread
+            with thread_run_lock(self.user):
+                pipeline = SentenceSpeechPipeline(self.user)
+                for audio in pipeline.run(self._forward_run_events(iter_answer_events(self.user, message), emit)):
+                    self._check_closed()
+                    emit(audio)
+            emit({"type": "done", "response": pipeline.response_text})
+        except SessionClosedError:
+            pass
+        except ThreadBusyError as e:
+            emit({"type": "error", "error": str(e)})
+        except Exception as e:
+            emit({"type": "error", "error": f"Failed to process assistant message: {str(e)}"})
+        finally:
+            connection.close()
+            emit(None)
+
+    def _forward_run_events(self, run_events, emit):
+        try:
+            for event_type, payload in run_events:
+                self._check_closed()
+                if event_type == "text_delta":
+                    emit({"type": "delta", "text": payload})
+                elif event_type == "tool_call":
+                    emit({"type": "tool", "name": payload, "message": TOOL_PROGRESS_MESSAGES.get(payload, "Working on it…")})
+                yield event_type, payload
+        finally:
+            run_events.close()
+
+    def _check_closed(self):
+        if self.closed.is_set():
+            raise SessionClosedError()
+
+    async def _send_json(self, data):
+        await self.send({"type": "websocket.send", "text": json.dumps(data)})
+
+
+def _get_user(authentication, validated_token):
+    try:
+        return authentication.get_user(validated_token)
+    finally:
+        connection.close()
+
+
+async def voice_session_application(scope, receive, send):
+    await VoiceSession(scope, receive, send).run()
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'performate_core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, it uses the models
+from django.conf import settings  # noqa: E402
+from main_app.voice_session import voice_session_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket" and scope["path"] == settings.VOICE_SESSION_PATH:
+        await voice_session_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -36,6 +36,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
 
+# Texts that accompany the raw audio response of the voice endpoint
+CORS_EXPOSE_HEADERS = ["X-Input-Text", "X-Response-Text"]
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -117,6 +120,22 @@ DATABASES = {
     }
 }
 
+# The cache must be shared by all workers: Redis if REDIS_URL is set, otherwise files on this host
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR', str(BASE_DIR / '.cache' / 'django')),
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -164,3 +183,103 @@ AUTH_USER_MODEL = "users.User"
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 ELEVEN_LABS_API_KEY = os.getenv('ELEVEN_LABS_API_KEY')
+
+# Assistant runs are driven by streamed run events; polling is only a fallback
+ASSISTANT_RUN_STREAMING = os.getenv('ASSISTANT_RUN_STREAMING', 'True') == 'True'
+ASSISTANT_RUN_DEADLINE_SECONDS = 120
+# A streamed run whose events stop for this long is cancelled
+ASSISTANT_RUN_STREAM_READ_TIMEOUT = 30
+ASSISTANT_RUN_POLL_INITIAL_DELAY = 0.1
+ASSISTANT_RUN_POLL_MAX_DELAY = 2.0
+
+# Size of the audio chunks forwarded from ElevenLabs to the client
+ELEVEN_LABS_STREAM_CHUNK_SIZE = 4096
+
+# Voice replies are synthesized per sentence while the assistant is still generating
+TTS_PIPELINE_MAX_WORKERS = 3
+TTS_PIPELINE_MIN_SENTENCE_CHARS = 20
+
+# Read-only assistant tools requested in the same step run concurrently
+TOOL_EXECUTOR_MAX_WORKERS = 4
+
+# check_due_date_tasks only looks at tasks due within the horizon and returns at most MAX_ROWS of them
+DUE_DATE_TASKS_HORIZON_DAYS = 7
+DUE_DATE_TASKS_MAX_ROWS = 50
+DUE_DATE_TASKS_CHUNK_SIZE = 200
+
+# ElevenLabs voice catalog: fresh for VOICE_CATALOG_TTL, then served stale while it refreshes in the background
+VOICE_CATALOG_TTL = 60 * 60
+VOICE_CATALOG_STALE_TTL = 7 * 24 * 60 * 60
+VOICE_CATALOG_CACHE_PATH = os.getenv('VOICE_CATALOG_CACHE_PATH', str(BASE_DIR / '.cache' / 'voice_catalog.json'))
+
+# ElevenLabs voice settings are cached per voice_id in the shared cache and written through on update;
+# the TTL bounds how long changes made outside the app go unnoticed
+VOICE_SETTINGS_CACHE_TTL = 10 * 60
+
+# Pooled HTTP client used for all ElevenLabs calls
+ELEVEN_LABS_POOL_MAXSIZE = 10
+ELEVEN_LABS_CONNECT_TIMEOUT = 3.05
+ELEVEN_LABS_READ_TIMEOUT = 30
+ELEVEN_LABS_MAX_RETRIES = 2
+
+# Background jobs (services/jobs.py), processed by `python manage.py run_jobs`
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 5
+JOB_VISIBILITY_TIMEOUT = 5 * 60
+JOB_WAIT_TIMEOUT = 60
+JOB_WORKER_POLL_INTERVAL = 1.0
+
+# Unassigned OpenAI threads kept ready for new users, topped up by `python manage.py top_up_thread_pool`
+THREAD_POOL_SIZE = 10
+THREAD_POOL_MAX_AGE = 30 * 24 * 60 * 60
+
+# Largest accepted voice message upload (the Whisper API limit). Uploads above
+# FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to a per-request temporary file by Django.
+AUDIO_UPLOAD_MAX_BYTES = 25 * 1024 * 1024
+
+# Voice uploads are downmixed to mono, resampled and (with ffmpeg) compressed before transcription
+AUDIO_PREPROCESSING = True
+AUDIO_PREPROCESS_SAMPLE_RATE = 16000
+AUDIO_PREPROCESS_BITRATE = "24k"
+AUDIO_PREPROCESS_TIMEOUT = 30
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+
+# Voice activity detection (services/voice_activity.py): silence is trimmed and long recordings are split at pauses
+VAD_ENABLED = True
+VAD_FRAME_MS = 30
+VAD_ENERGY_THRESHOLD_DB = -45
+VAD_DYNAMIC_RANGE_DB = 40
+VAD_MIN_SPEECH_MS = 120
+VAD_MIN_PAUSE_MS = 600
+VAD_PADDING_MS = 250
+VAD_MAX_SEGMENT_SECONDS = 30
+# Segments of one recording transcribed concurrently
+TRANSCRIPTION_MAX_WORKERS = 4
+
+# Synthesized speech is cached on disk by content hash, beyond MAX_BYTES the least recently used clips
+# are evicted down to LOW_WATER_BYTES
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', str(BASE_DIR / '.cache' / 'tts'))
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+TTS_CACHE_LOW_WATER_BYTES = int(TTS_CACHE_MAX_BYTES * 0.9)
+
+# WebSocket voice session (main_app/voice_session.py), served by the ASGI application
+VOICE_SESSION_PATH = '/api/main/voice-session/'
+
+# Assistant runs on a user's thread are serialized (services/thread_runs.py), waiting requests give up after WAIT_SECONDS
+THREAD_RUN_WAIT_SECONDS = 30
+THREAD_RUN_LOCK_MARGIN = 30
+THREAD_RUN_POLL_INITIAL_DELAY = 0.1
+THREAD_RUN_POLL_MAX_DELAY = 1.0
+# Runs active for longer than STALE_SECONDS on threads with an abandoned lock are cancelled every REAPER_INTERVAL
+# by the `run_jobs` worker
+THREAD_RUN_STALE_SECONDS = 2 * ASSISTANT_RUN_DEADLINE_SECONDS
+THREAD_RUN_REAPER_INTERVAL = 5 * 60
+
+# Simple commands are answered without an assistant run (services/intent_router.py) when a task title matches
+# with at least MIN_SCORE similarity and MIN_MARGIN ahead of the next best title
+INTENT_ROUTER_ENABLED = True
+INTENT_ROUTER_MIN_SCORE = 0.8
+INTENT_ROUTER_MIN_MARGIN = 0.1
+INTENT_ROUTER_LIST_LIMIT = 10
+INTENT_ROUTER_INDEX_MAX_USERS = 1000
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_time_zone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='assistant_instructions_hash',
+            field=models.CharField(blank=True, help_text="Hash of the instructions last pushed to the user's assistant.", max_length=64, null=True),
+        ),
+    ]
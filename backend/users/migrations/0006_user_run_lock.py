@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_assistant_instructions_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='run_lock_token',
+            field=models.CharField(blank=True, help_text="Token of the request currently running the assistant on the user's thread.", max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='run_locked_until',
+            field=models.DateTimeField(blank=True, help_text='End of the current run lock, or when the last one was released.', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_run_lock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='run_locked_until',
+            field=models.DateTimeField(blank=True, help_text='End of the current run lock lease.', null=True),
+        ),
+    ]
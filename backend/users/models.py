@@ -81,6 +81,23 @@ class User(AbstractUser):
         help_text="Time zone of the user.",
         default="Europe/Berlin"
     )
+    assistant_instructions_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        help_text="Hash of the instructions last pushed to the user's assistant."
+    )
+    run_lock_token = models.CharField(
+        max_length=32,
+        blank=True,
+        null=True,
+        help_text="Token of the request currently running the assistant on the user's thread."
+    )
+    run_locked_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="End of the current run lock lease."
+    )
 
     USERNAME_FIELD: str = "email"  # is used as the unique identifier
     EMAIL_FIELD: str = "email"
@@ -7,24 +7,54 @@ interface ChatProps {
     onTaskAdded: () => void;
 }
 
+interface VoiceResult {
+  response: string;
+  input_text: string;
+  error?: string;
+}
+
+const indexOfBytes = (haystack: Uint8Array, needle: Uint8Array, from: number) => {
+  outer: for (let i = from; i <= haystack.length - needle.length; i++) {
+    for (let j = 0; j < needle.length; j++) {
+      if (haystack[i + j] !== needle[j]) continue outer;
+    }
+    return i;
+  }
+  return -1;
+};
+
+// Splits a multipart/mixed body into its parts: [content type, bytes]
+const parseMultipartMixed = (body: Uint8Array, boundary: string) => {
+  const delimiter = new TextEncoder().encode(`--${boundary}`);
+  const headerEnd = new TextEncoder().encode("\r\n\r\n");
+  const parts: [string, Uint8Array][] = [];
+
+  let start = indexOfBytes(body, delimiter, 0);
+  while (start !== -1) {
+    const next = indexOfBytes(body, delimiter, start + delimiter.length);
+    if (next === -1) break;
+
+    const headersEnd = indexOfBytes(body, headerEnd, start);
+    const headers = new TextDecoder().decode(body.slice(start + delimiter.length, headersEnd));
+    const contentType = headers.match(/Content-Type: (.*)/i)?.[1].trim() ?? "";
+    // The part ends with a CRLF before the next delimiter
+    parts.push([contentType, body.slice(headersEnd + headerEnd.length, next - 2)]);
+    start = next;
+  }
+  return parts;
+};
+
 export const Chat: FC<ChatProps> = ({ onTaskAdded }) => {
   const [messages, setMessages] = useState<{ sender: string; text: string }[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const [input, setInput] = useState("");
 
-const playAudio = (base64Audio: string) => {
+const playAudio = (audioBlob: Blob) => {
     try {
-        const binaryString = atob(base64Audio);
-        const binaryData = new Uint8Array(binaryString.length);
-
-        for (let i = 0; i < binaryString.length; i++) {
-        binaryData[i] = binaryString.charCodeAt(i);
-        }
-
-        const audioBlob = new Blob([binaryData], { type: "audio/mpeg" });
         const audioUrl = URL.createObjectURL(audioBlob);
 
         const audio = new Audio(audioUrl);
+        audio.onended = () => URL.revokeObjectURL(audioUrl);
         audio.play();
     } catch (error) {
         toast.error(`Failed to play audio. Error: ${error}`, { position: "top-right" });
@@ -52,6 +82,8 @@ const playAudio = (base64Audio: string) => {
               method: "POST",
               headers: {
                 Authorization: `Bearer ${access_token}`,
+                // Raw audio instead of base64 in JSON, followed by the texts in a JSON part
+                Accept: "multipart/mixed",
               },
               body: formData,
             }
@@ -61,15 +93,27 @@ const playAudio = (base64Audio: string) => {
             throw new Error(`Failed to process voice message. Reason: ${response.statusText}`);
           }
 
-          const data = await response.json();
+          const boundary = response.headers.get("Content-Type")?.match(/boundary=([^;]+)/)?.[1] ?? "";
+          const parts = parseMultipartMixed(new Uint8Array(await response.arrayBuffer()), boundary);
+          const audioPart = parts.find(([contentType]) => contentType === "audio/mpeg");
+          const resultPart = parts.find(([contentType]) => contentType === "application/json");
+          if (!resultPart) {
+            throw new Error("The response is incomplete");
+          }
+
+          const result: VoiceResult = JSON.parse(new TextDecoder().decode(resultPart[1]));
+          if (result.error) {
+            throw new Error(result.error);
+          }
+          const audioBlob = new Blob([audioPart ? audioPart[1] : new Uint8Array()], { type: "audio/mpeg" });
 
           setMessages((prev) => [
             ...prev,
-            { sender: "user", text: data.input_text },
-            { sender: "assistant", text: data.response },
+            { sender: "user", text: result.input_text },
+            { sender: "assistant", text: result.response },
           ]);
 
-          playAudio(data.audio_response);
+          playAudio(audioBlob);
 
           onTaskAdded();
         } catch (error) {
@@ -81,6 +125,13 @@ const playAudio = (base64Audio: string) => {
   };
 
 
+  const updateLastAssistantMessage = (text: string) => {
+    setMessages((prev) => [
+      ...prev.slice(0, -1),
+      { sender: "assistant", text },
+    ]);
+  };
+
   const sendMessage = async () => {
     if (!input.trim()) return;
 
@@ -89,25 +140,54 @@ const playAudio = (base64Audio: string) => {
 
     try {
       const access_token = localStorage.getItem("access");
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/main/assistant-request/`, {
+      const response = await fetch(`${import.meta.env.VITE_API_URL}/main/assistant-request/stream/`, {
         method: "POST",
         headers: {
           Authorization: `Bearer ${access_token}`,
           "Content-Type": "application/json",
+          Accept: "text/event-stream",
         },
         body: JSON.stringify({ message: input }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`Failed to process text message. Reason: ${response.statusText}`);
         
       }
 
-      const data = await response.json();
-      setMessages((prev) => [
-        ...prev,
-        { sender: "assistant", text: data.response },
-      ]);
+      setMessages((prev) => [...prev, { sender: "assistant", text: "" }]);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let text = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+
+        for (const rawEvent of events) {
+          const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const eventData = rawEvent.match(/^data: (.*)$/m)?.[1];
+          if (!eventName || !eventData) continue;
+
+          const data = JSON.parse(eventData);
+          if (eventName === "delta") {
+            text += data.text;
+            updateLastAssistantMessage(text);
+          } else if (eventName === "tool" && !text) {
+            updateLastAssistantMessage(data.message);
+          } else if (eventName === "done") {
+            updateLastAssistantMessage(data.response);
+          } else if (eventName === "error") {
+            throw new Error(data.error);
+          }
+        }
+      }
 
       onTaskAdded();
     } catch (error) {
@@ -2,11 +2,6 @@ import React, { useEffect, useState } from "react";
 import { Link, useNavigate } from "react-router-dom";
 import { useAuth } from "../context/Authcontext";
 
-interface Notification {
-  id: number;
-  is_read: boolean;
-}
-
 export const Navbar: React.FC = () => {
   const { isAuthenticated, logout, name } = useAuth();
   const navigate = useNavigate();
@@ -14,13 +9,12 @@ export const Navbar: React.FC = () => {
 
   useEffect(() => {
     if (isAuthenticated) {
-      fetch(`${import.meta.env.VITE_API_URL}/main/notifications/`, {
+      fetch(`${import.meta.env.VITE_API_URL}/main/notifications/unread-count/`, {
         headers: { Authorization: `Bearer ${localStorage.getItem("access")}` },
       })
         .then((res) => res.json())
-        .then((data: Notification[]) => {
-          const unread = data.filter((notif) => !notif.is_read).length;
-          setUnreadCount(unread);
+        .then((data: { unread_count: number }) => {
+          setUnreadCount(data.unread_count);
         })
         .catch((err) => console.error("Error fetching notifications:", err));
     }